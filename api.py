@@ -0,0 +1,285 @@
+"""Headless JSON API of the statistics behind the room page.
+
+Serves the numbers of the dashboard figures from the same registry datasets, without Streamlit or
+matplotlib. All endpoints are GET requests with the optional query parameters parameter, period
+and season:
+    /api/rooms                           rooms with their names and buildings
+    /api/rooms/{rooms}/categories        time distribution (%) in comfort categories
+    /api/rooms/{rooms}/stats             min, mean, std and max
+    /api/rooms/{rooms}/box               monthly box-plot statistics (occupied hours)
+    /api/rooms/{rooms}/window            monthly window openings and time open
+    /api/outdoor/box                     monthly box-plot statistics of the outdoor climate
+`{rooms}` is a room, a comma-separated list of rooms or 'all', several rooms are returned as a
+room -> result object. POST /api/batch with {"requests": [path, ...]} answers many requests in one
+call. Responses are cached per path and data version with an ETag, a request with a matching
+If-None-Match header gets 304 Not Modified.
+
+Run the API (default port 8502):
+    python api.py [--host HOST] [--port PORT]
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import numpy as np
+import pandas as pd
+from settings import *
+from comfort_stats import PARAMETERS, PERIODS, DESCRIPTIVE
+from registry import registry
+from rollups import ROOM_PARAMETERS, OUTDOOR_PARAMETERS, OUTDOOR, STATS
+
+PORT = int(os.environ.get('MOBISTYLE_API_PORT', 8502))
+# Cached responses, the least recently used are dropped above this number
+MAX_RESPONSES = int(os.environ.get('MOBISTYLE_API_CACHE', 4096))
+QUERY = ['parameter', 'period', 'season']
+
+
+def value(x):
+    """JSON value of a table cell, null for missing values."""
+    return None if pd.isna(x) else round(float(x), 3)
+
+
+def check(name, given, allowed):
+    if given is not None and given not in allowed:
+        raise ValueError(f'unknown {name} {given!r}, expected one of {list(allowed)}')
+
+
+def select(df, **columns):
+    """Rows of `df` with the given column values, None matches all."""
+    mask = np.ones(len(df), dtype=bool)
+    for column, given in columns.items():
+        if given is not None:
+            mask &= (df[column] == given).to_numpy()
+    return df[mask]
+
+
+# ENDPOINTS
+def rooms():
+    return [{'room': room, 'name': name, 'building': building} for room, name, building in room_config]
+
+
+def comfort(room, parameter=None, period=None, season=None, descriptive=False):
+    """parameter -> period -> season -> statistic -> value from the comfort statistics table."""
+    stats = registry.get('comfort_stats')
+    check('parameter', parameter, PARAMETERS)
+    check('period', period, PERIODS)
+    check('season', season, set(stats['Season']))
+    rows = select(stats, Room=room, Parameter=parameter, Monitoring_Period=period, Season=season)
+    rows = rows[rows['Statistic'].isin(DESCRIPTIVE) == descriptive]
+    result = {}
+    for keys in zip(rows['Parameter'], rows['Monitoring_Period'], rows['Season'], rows['Statistic'], rows['Value']):
+        level = result
+        for key in keys[:-2]:
+            level = level.setdefault(key, {})
+        level[keys[-2]] = value(keys[-1])
+    return result
+
+
+def categories(room, parameter=None, period=None, season=None):
+    return comfort(room, parameter, period, season)
+
+
+def stats(room, parameter=None, period=None, season=None):
+    return comfort(room, parameter, period, season, descriptive=True)
+
+
+def box(room, parameter=None, period=None, season=None):
+    """parameter -> period -> monthly box-plot statistics."""
+    check('parameter', parameter, OUTDOOR_PARAMETERS if room == OUTDOOR else ROOM_PARAMETERS)
+    check('period', period, PERIODS)
+    if season is not None:
+        raise ValueError('box-plot statistics are monthly, season is not supported')
+    rows = select(registry.get('box_stats'), Room=room, Parameter=parameter, Monitoring_Period=period)
+    result = {}
+    for (parameter, period), group in rows.groupby(['Parameter', 'Monitoring_Period'], sort=False):
+        result.setdefault(parameter, {})[period] = [
+            dict(Month=int(month), **{stat: value(x) for stat, x in zip(STATS, values)})
+            for month, values in zip(group['Month'], group[STATS].to_numpy())]
+    return result
+
+
+def window(room, parameter=None, period=None, season=None):
+    """period -> monthly window openings and time open (%)."""
+    check('period', period, PERIODS)
+    if parameter is not None or season is not None:
+        raise ValueError('window counts are monthly, parameter and season are not supported')
+    counts = registry.get(f'window_{room}')
+    result = {}
+    for name, (start, end) in {'BASELINE': (BL_start, BL_end), 'MOBISTYLE': (MS_start, MS_end)}.items():
+        if period in (None, name):
+            rows = counts[(counts.index >= start) & (counts.index < end)]
+            result[name] = [{'Month': f'{month:%Y-%m}', 'Openings': int(openings),
+                             'Time open [%]': value(open_ / samples * 100) if samples else None}
+                            for month, openings, open_, samples in
+                            zip(rows.index, rows['Openings'], rows['Open'], rows['Samples'])]
+    return result
+
+
+ROOM_ENDPOINTS = {'categories': categories, 'stats': stats, 'box': box, 'window': window}
+
+
+def route(path, query):
+    """Result of a GET request, LookupError for unknown paths and rooms, ValueError for invalid queries."""
+    unknown = set(query) - set(QUERY)
+    if unknown:
+        raise ValueError(f'unknown query parameters {sorted(unknown)}, expected {QUERY}')
+    parts = path.strip('/').split('/')
+    if parts == ['api', 'rooms']:
+        return rooms()
+    if parts == ['api', 'outdoor', 'box']:
+        return box(OUTDOOR, **query)
+    if len(parts) == 4 and parts[:2] == ['api', 'rooms'] and parts[3] in ROOM_ENDPOINTS:
+        func = ROOM_ENDPOINTS[parts[3]]
+        names = room_lst if parts[2] == 'all' else parts[2].split(',')
+        for room in names:
+            if room not in room_lst:
+                raise LookupError(f'unknown room {room!r}')
+        if len(names) == 1 and parts[2] != 'all':
+            return func(names[0], **query)
+        return {room: func(room, **query) for room in names}
+    raise LookupError(f'unknown path {path!r}')
+
+
+# RESPONSE CACHE
+class ResponseCache:
+    """Encoded responses (status, body, ETag) per request and data version, LRU."""
+
+    def __init__(self, max_responses=MAX_RESPONSES):
+        self.max_responses = max_responses
+        self.hits, self.misses = 0, 0
+        self.version = None
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, version, key):
+        with self._lock:
+            if version != self.version:
+                self._items.clear()
+                self.version = version
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key]
+            self.misses += 1
+
+    def put(self, version, key, response):
+        with self._lock:
+            if version == self.version:
+                self._items[key] = response
+                while len(self._items) > self.max_responses:
+                    self._items.popitem(last=False)
+
+
+response_cache = ResponseCache()
+
+
+def canonical(url):
+    """Path and query of a request URL, query parameters sorted."""
+    parts = urlsplit(url)
+    query = sorted(parse_qsl(parts.query))
+    return parts.path.rstrip('/') + (f'?{urlencode(query)}' if query else '')
+
+
+def respond(url):
+    """(status, JSON body, ETag) of a GET request, from the response cache if possible."""
+    version = registry.sync()
+    key = canonical(url)
+    response = response_cache.get(version, key)
+    if response is None:
+        parts = urlsplit(key)
+        try:
+            status, result = 200, route(parts.path, dict(parse_qsl(parts.query)))
+        except LookupError as error:
+            status, result = 404, {'error': str(error)}
+        except ValueError as error:
+            status, result = 400, {'error': str(error)}
+        body = json.dumps(result).encode()
+        response = (status, body, f'"{hashlib.sha1(body).hexdigest()[:20]}"')
+        response_cache.put(version, key, response)
+    return response
+
+
+def batch(body):
+    """Responses of a batch of GET requests: {"requests": [path, ...]} -> [{path, status, body}, ...]."""
+    try:
+        paths = json.loads(body)['requests']
+    except (ValueError, KeyError, TypeError):
+        return 400, {'error': 'expected {"requests": [path, ...]}'}
+    if not isinstance(paths, list) or not all(isinstance(path, str) for path in paths):
+        return 400, {'error': 'expected {"requests": [path, ...]}'}
+    responses = []
+    for path in paths:
+        status, data, _ = respond(path)
+        responses.append({'path': path, 'status': status, 'body': json.loads(data)})
+    return 200, responses
+
+
+# SERVER
+class Handler(BaseHTTPRequestHandler):
+    # Keep-alive connections, headers and body are sent without waiting for the ACK of the previous write
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    quiet = True
+
+    def send(self, status, body=b'', etag=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if etag:
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        if body and self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def do_GET(self):
+        status, body, etag = respond(self.path)
+        if status == 200 and etag in [tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')]:
+            self.send(304, etag=etag)
+        else:
+            self.send(status, body, etag if status == 200 else None)
+
+    do_HEAD = do_GET
+
+    def do_POST(self):
+        if canonical(self.path) != '/api/batch':
+            self.send(404, json.dumps({'error': f'unknown path {self.path!r}'}).encode())
+            return
+        status, result = batch(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        self.send(status, json.dumps(result).encode())
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+
+def serve(host='', port=PORT, quiet=True):
+    """HTTP server of the API, one thread per connection. Call serve_forever() to run it."""
+    Handler.quiet = quiet
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='JSON API of the room statistics.')
+    parser.add_argument('--host', default='', help='interface to listen on (default: all)')
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--log', action='store_true', help='log every request')
+    args = parser.parse_args()
+
+    server = serve(args.host, args.port, quiet=not args.log)
+    print(f'Serving on http://{args.host or "0.0.0.0"}:{server.server_address[1]}/api/rooms')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
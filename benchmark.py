@@ -0,0 +1,280 @@
+"""Benchmarks of the data loaders, the room data preparation, the statplots figures and app startup.
+
+Every data size is a synthetic data set (synthetic.py) of all rooms, benchmarked in its own
+process with MOBISTYLE_DATA_DIR pointing to it. Each stage is timed `repeat` times and the best
+time is kept. Results are compared with the stored baseline, a stage is a regression when it is
+slower than the baseline by more than the threshold (relative) and by more than MIN_SECONDS.
+Startup stages (imports, first render of each page) are timed in fresh processes, `repeat` times.
+
+Run the benchmarks and compare with the baseline, exit code 1 on regression:
+    python benchmark.py
+Store the results as the new baseline:
+    python benchmark.py --save
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import ExitStack
+from unittest import mock
+
+import pandas as pd
+import synthetic
+from settings import *
+
+BASELINE = './Results/Benchmarks/baseline.json'
+# Data size -> (years, sampling interval)
+SIZES = {
+    '1y': (1, '15min'),
+    '2y': (2, '15min'),
+    '4y': (4, '15min'),
+    '2y-5min': (2, '5min'),
+}
+REPEAT = 3
+THRESHOLD = .25
+MIN_SECONDS = .05
+
+
+def best_time(func, repeat):
+    """Best run time of `func` in seconds and its result."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def api_requests(port, paths, requests, threads):
+    """Send `requests` GET requests for `paths` to the API on localhost, over `threads` keep-alive connections."""
+    import http.client
+    from concurrent.futures import ThreadPoolExecutor
+
+    def client(n):
+        connection = http.client.HTTPConnection('127.0.0.1', port)
+        for i in range(n):
+            connection.request('GET', paths[i % len(paths)])
+            response = connection.getresponse()
+            response.read()
+            assert response.status == 200, response.status
+        connection.close()
+
+    with ThreadPoolExecutor(threads) as executor:
+        list(executor.map(client, [requests // threads] * threads))
+
+
+def run_stages(repeat=REPEAT):
+    """Time all stages on the data set in MOBISTYLE_DATA_DIR, stage -> seconds."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import datacache
+    import partitions
+    import prerender
+    import statplots
+    import warmup
+    from comfort_stats import comfort_stats, room_counts
+    from rollups import room_data, daily_data, room_box_stats
+    from episodes import episode_index, window_counts
+    from density import density_grids
+    from degreedays import daily_mean, degree_days
+    from categorize import COOLING_TEMP, comfort_arrays, limit_set, recategorized_stats
+    from figcache import render_figure
+
+    room = room_lst[0]
+    times = {}
+
+    def stage(name, func, repeat=repeat):
+        times[name], result = best_time(func, repeat)
+        return result
+
+    # LOADERS
+    stage('read_room_csv', lambda: datacache.read_room_csv(room))
+    stage('read_outdoor_csv', datacache.read_outdoor_csv)
+    stage('convert_all', lambda: [datacache.convert(name) for name in datacache.datasets()], repeat=1)
+    data = stage('load_room', lambda: datacache.load_room(room))
+    outdoor = stage('load_outdoor', datacache.load_outdoor)
+    daily = stage('daily_mean', lambda: daily_mean(outdoor))
+    stage('degree_days', lambda: degree_days(daily, 16.5, 22.5))
+    stage('partition_room', lambda: partitions.partition(room), repeat=1)
+    start = data.index[0].normalize()
+    stage('query_month', lambda: partitions.read_room(room, start, start + pd.DateOffset(months=1)))
+
+    # ROOM DATA PREPARATION
+    stage('room_data', lambda: room_data(data, outdoor))
+    stage('daily_data', lambda: daily_data(data, outdoor))
+    index = stage('episode_index', lambda: episode_index(data))
+    stage('window_counts', lambda: window_counts(index))
+    stage('room_counts', lambda: room_counts(data))
+    stage('room_box_stats', lambda: room_box_stats(data, room))
+    stage('density_grids', lambda: density_grids(data, outdoor))
+    stats = stage('comfort_stats_all_rooms',
+                  lambda: comfort_stats({room: datacache.load_room(room) for room in room_lst}))
+    arrays = {room: comfort_arrays(datacache.load_room(room)) for room in room_lst}
+    stage('comfort_arrays', lambda: comfort_arrays(data))
+    stage('recategorize_all_rooms', lambda: recategorized_stats(stats, arrays, limit_set(
+        {'CO2': [750, 900, 1000], 'Temperature': {'COOLING': COOLING_TEMP}})))
+
+    # Default aggregates of the room page from the registry, the loaded rooms must stay memory-mapped
+    from registry import registry
+    for name in room_lst:
+        registry.get(f'Data_{name}')
+    stage('registry_default_aggregates', lambda: [registry.get(dataset.format(room=name)) for name in room_lst
+                                                  for dataset in warmup.DATASETS], repeat=1)
+    copied = registry.memory_report().query('not Mapped').index.tolist()
+    if copied:
+        raise RuntimeError(f'columns of {copied} copied from the memory-mapped cache by an aggregate')
+
+    # JSON API, first requests load the datasets, then requests are answered from the response cache
+    import api
+    server = api.serve('127.0.0.1', 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    paths = [f'/api/rooms/{room}/{endpoint}' for room in room_lst for endpoint in api.ROOM_ENDPOINTS]
+    stage('api_first_requests', lambda: api_requests(server.server_address[1], paths, len(paths), 1), repeat=1)
+    stage('api_1000_cached_requests', lambda: api_requests(server.server_address[1], paths, 1000, 8))
+    server.shutdown()
+    server.server_close()
+
+    # STATPLOTS
+    for job in prerender.figure_jobs([room]):
+        filename, func = job[:2]
+        args = prerender.job_args(job)
+        name = filename[:-len('.png')].replace(f'_{room}', '')
+        stage(f'figure {name}', lambda: render_figure(getattr(statplots, func)(*args)))
+    return times
+
+
+def ticked(labels):
+    """Context in which the Streamlit checkboxes `labels` -> value are set, the others keep their default."""
+    import streamlit as st
+    stack = ExitStack()
+    for owner in (st, st.sidebar):
+        checkbox = owner.checkbox
+        stack.enter_context(mock.patch.object(owner, 'checkbox', lambda label, *args, checkbox=checkbox, **kwargs:
+                                              labels.get(label, checkbox(label, *args, **kwargs))))
+    return stack
+
+
+def run_startup():
+    """Import and first render times of a fresh app process, stage -> seconds.
+    Pages run in Streamlit bare mode, with the Feather cache built and empty figure caches.
+    """
+    times = {}
+
+    def stage(name, func):
+        start = time.perf_counter()
+        result = func()
+        times[name] = time.perf_counter() - start
+        return result
+
+    stage('startup import app', lambda: __import__('mobistyle_app'))
+    home = stage('startup import home', lambda: __import__('home'))
+    stage('startup first render home', home.app)
+    room = stage('startup import room', lambda: __import__('room'))
+    stage('startup first render room', room.app)
+    stage('startup second render room', room.app)
+    # Sections off by default, with static and interactive charts
+    for mode, interactive in [('static', False), ('interactive', True)]:
+        with ticked({'Time series': True, 'Interactive charts': interactive}):
+            stage(f'startup render room time series {mode}', room.app)
+    return times
+
+
+def run_process(option, data_dir, repeat):
+    """Stage times printed by this script run with `option` in a new process."""
+    env = dict(os.environ, MOBISTYLE_DATA_DIR=data_dir, MOBISTYLE_RENDER_WORKERS='1', MPLBACKEND='Agg')
+    for name in ('MOBISTYLE_FIGURE_CACHE_DIR', 'MOBISTYLE_WARMUP'):
+        env.pop(name, None)
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), option, '--repeat', str(repeat)],
+                            env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+                            stdout=subprocess.PIPE, check=True, universal_newlines=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def benchmark(sizes, repeat=REPEAT, workdir=None):
+    """Results of all sizes: size -> {'rows': rows per room, 'stages': stage -> seconds}."""
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = workdir or tmp
+        results = {}
+        for size in sizes:
+            years, freq = SIZES[size]
+            data_dir = os.path.join(workdir, size)
+            if not os.path.exists(os.path.join(data_dir, 'outdoor_data.csv')):
+                synthetic.write_dataset(data_dir, years=years, freq=freq)
+            rows = len(synthetic.timestamps(years=years, freq=freq))
+
+            print(f'{size}: {rows} rows per room', file=sys.stderr)
+            stages = run_process('--stages', data_dir, repeat)
+            startup = [run_process('--startup', data_dir, repeat) for _ in range(repeat)]
+            stages.update({name: min(run[name] for run in startup) for name in startup[0]})
+            results[size] = {'rows': rows, 'stages': stages}
+    return results
+
+
+def environment():
+    import numpy, matplotlib
+    return {'python': platform.python_version(), 'machine': platform.machine(), 'processor': platform.processor(),
+            'numpy': numpy.__version__, 'pandas': pd.__version__, 'matplotlib': matplotlib.__version__}
+
+
+def compare(results, baseline, threshold=THRESHOLD, min_seconds=MIN_SECONDS):
+    """Table of the stage times and their baseline, with the regressions marked."""
+    rows = []
+    for size, result in results.items():
+        stages = baseline.get('results', {}).get(size, {}).get('stages', {})
+        for name, seconds in result['stages'].items():
+            base = stages.get(name)
+            rows.append({'Size': size, 'Stage': name, 'Time [s]': seconds, 'Baseline [s]': base,
+                         'Ratio': seconds / base if base else None,
+                         'Regression': base is not None and seconds > base * (1 + threshold)
+                         and seconds - base > min_seconds})
+    return pd.DataFrame(rows, columns=['Size', 'Stage', 'Time [s]', 'Baseline [s]', 'Ratio', 'Regression'])
+
+
+def read_baseline(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except OSError:
+        return {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the app on synthetic data sets.')
+    parser.add_argument('--sizes', nargs='*', default=list(SIZES), choices=list(SIZES))
+    parser.add_argument('--repeat', type=int, default=REPEAT, help='runs per stage, the best one is kept')
+    parser.add_argument('--baseline', default=BASELINE, help='baseline file')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD, help='relative slowdown of a regression')
+    parser.add_argument('--workdir', default=None, help='keep the synthetic data sets in this directory')
+    parser.add_argument('--save', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--stages', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--startup', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.stages:
+        print(json.dumps(run_stages(args.repeat)))
+        return
+    if args.startup:
+        print(json.dumps(run_startup()))
+        return
+
+    results = benchmark(args.sizes, args.repeat, args.workdir)
+    table = compare(results, read_baseline(args.baseline), args.threshold)
+    print(table.to_string(index=False, float_format=lambda x: f'{x:.3f}'))
+
+    if args.save:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump({'environment': environment(), 'results': results}, f, indent=2)
+        print(f'Baseline written to {args.baseline}')
+    elif table['Regression'].any():
+        print(f"{table['Regression'].sum()} stages slower than the baseline")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""Comfort categories of other category limits (what-if analysis).
+
+The Category_* columns of the data files are binned with the settings bins. For other limits, the
+occupied readings of each room are kept sorted within each monitoring period and season
+(`comfort_arrays`), so the category counts of a limit set are found with np.searchsorted of the
+limits alone. Limits are set per parameter and optionally per season. The new time distribution in
+categories replaces that of the comfort_stats table, so the result has its layout and works with its
+tables. All rooms take a few milliseconds, results are cached per limit set in the registry
+(`registry.what_if_stats`). Values are binned as stored in the cache (float32), a reading within
+float32 precision of a limit may fall in the neighbouring category.
+
+A limit set maps parameter -> season -> inner category limits, season 'All' is used for the seasons
+without limits of their own:
+    {'CO2': {'All': (750, 900, 1000)},
+     'Temperature': {'All': (19, 20, 21, 23, 24, 25), 'COOLING': (22, 23, 23.5, 25.5, 26, 27)}}
+"""
+import hashlib
+import json
+
+import numpy as np
+import pandas as pd
+from settings import *
+from comfort_stats import PARAMETERS, PERIODS, COLUMNS, INPUT_COLUMNS, category_codes
+from datacache import select_columns
+
+ALL = 'All'
+KEYS = COLUMNS[:-1]
+# Parameter -> inner category limits of the settings bins
+LIMITS = {'Temperature': bins_TEMP[1:-1], 'RH': bins_RH[1:-1], 'CO2': bins_CO2[1:-1], 'VOC': bins_VOC[1:-1]}
+# EN 15251 indoor temperature categories of the cooling season (I: 23.5-25.5, II: 23-26, III: 22-27 degC),
+# the settings bins are those of the heating season
+COOLING_TEMP = [22, 23, 23.5, 25.5, 26, 27]
+
+
+def limit_set(changes=None):
+    """Complete limit set, the settings limits updated with `changes`.
+    A change is a list of limits for all seasons or a season -> limits dict.
+    """
+    limits = {parameter: {ALL: tuple(float(limit) for limit in edges)} for parameter, edges in LIMITS.items()}
+    for parameter, change in (changes or {}).items():
+        change = change if isinstance(change, dict) else {ALL: change}
+        for season, edges in change.items():
+            edges = tuple(float(limit) for limit in edges)
+            if len(edges) != len(PARAMETERS[parameter][1]) - 1:
+                raise ValueError(f'{parameter} needs {len(PARAMETERS[parameter][1]) - 1} limits, got {len(edges)}')
+            if any(np.diff(edges) <= 0):
+                raise ValueError(f'{parameter} limits must be increasing: {edges}')
+            limits[parameter][season] = edges
+    return limits
+
+
+def limit_key(limits):
+    """Short hash of a limit set."""
+    return hashlib.sha1(json.dumps(limits, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def comfort_arrays(df, occupied=True):
+    """Values of one room sorted within cells of monitoring period and season, for binning by searchsorted.
+    Cell p * (seasons + 1) + s + 1 holds the rows of period p and season s, s = -1 for rows without season;
+    `bounds` are the first rows of the cells. Missing values are at the end of their cell.
+    """
+    if occupied:
+        df = select_columns(df, ['Monitoring_Period'] + INPUT_COLUMNS, df['Room Status'].to_numpy() > 0)
+    seasons = sorted(pd.Series(df['Season']).dropna().unique())
+    period = category_codes(df['Monitoring_Period'], PERIODS)
+    season = category_codes(df['Season'], seasons)
+    valid = period >= 0
+    cell = (period * (len(seasons) + 1) + season + 1)[valid]
+    arrays = {'seasons': seasons,
+              'bounds': np.searchsorted(np.sort(cell), np.arange(len(PERIODS) * (len(seasons) + 1) + 1))}
+    for parameter in PARAMETERS:
+        values = df[parameter].to_numpy(dtype=np.float32)[valid]
+        arrays[parameter] = values[np.lexsort((values, cell))]
+    return arrays
+
+
+def category_counts(arrays, limits):
+    """Parameter -> category counts of one room with a limit set, an array of shape
+    (monitoring periods, seasons + 'All', categories + missing data) in the group layout of room_counts.
+    Categories include their upper limit, as pd.cut.
+    """
+    seasons, bounds = arrays['seasons'], arrays['bounds']
+    counts_dct = {}
+    for parameter, (_, labels) in PARAMETERS.items():
+        values = arrays[parameter]
+        counts = np.zeros((len(PERIODS), len(seasons) + 1, len(labels) + 1), dtype=np.int64)
+        for period in range(len(PERIODS)):
+            for season in range(-1, len(seasons)):
+                cell = period * (len(seasons) + 1) + season + 1
+                edges = limits[parameter].get(seasons[season] if season >= 0 else ALL, limits[parameter][ALL])
+                edges = np.array(edges + (np.inf,), dtype=np.float32)
+                # Number of values up to each limit, the values above the last limit are missing data
+                ends = np.searchsorted(values[bounds[cell]:bounds[cell + 1]], edges, side='right')
+                cell_counts = np.diff(ends, prepend=0, append=bounds[cell + 1] - bounds[cell])
+                counts[period, -1] += cell_counts
+                if season >= 0:
+                    counts[period, season] += cell_counts
+        counts_dct[parameter] = counts
+    return counts_dct
+
+
+def category_pct(arrays, limits):
+    """Time distribution (%) in comfort categories of one room as columns of a tidy table, 0 for empty groups."""
+    seasons = arrays['seasons'] + [ALL]
+    columns = {key: [] for key in COLUMNS[1:]}
+    for parameter, counts in category_counts(arrays, limits).items():
+        labels = PARAMETERS[parameter][1] + ['Missing data']
+        totals = counts.sum(axis=-1, keepdims=True)
+        columns['Parameter'].append(np.repeat(parameter, counts.size))
+        columns['Monitoring_Period'].append(np.repeat(PERIODS, len(seasons) * len(labels)))
+        columns['Season'].append(np.tile(np.repeat(seasons, len(labels)), len(PERIODS)))
+        columns['Statistic'].append(np.tile(labels, len(PERIODS) * len(seasons)))
+        columns['Value'].append((counts * 100 / np.where(totals > 0, totals, 1)).ravel())
+    return {key: np.concatenate(values) for key, values in columns.items()}
+
+
+def recategorized_stats(stats, arrays_dct, limits):
+    """comfort_stats table with the time distribution in comfort categories of a limit set.
+    The descriptive statistics do not depend on the limits and are kept.
+    """
+    blocks = [category_pct(arrays, limits) for arrays in arrays_dct.values()]
+    pct = pd.DataFrame({key: np.concatenate([block[key] for block in blocks]) for key in COLUMNS[1:]})
+    pct.insert(0, 'Room', np.repeat(list(arrays_dct), [len(block['Value']) for block in blocks]))
+    table = stats.merge(pct, on=KEYS, how='left', suffixes=('', '_new'))
+    return table.assign(Value=table.pop('Value_new').fillna(table['Value']))[COLUMNS]
@@ -0,0 +1,148 @@
+"""Comfort category statistics engine.
+
+Time distribution in comfort categories, percentage of missing data and descriptive statistics
+(min, mean, std, max) of every parameter are computed for each room, monitoring period and season
+in one vectorized pass per room: category codes and group codes are combined and counted with
+np.bincount. The result is one tidy table with columns
+    Room, Parameter, Monitoring_Period, Season, Statistic, Value
+where Season 'All' holds the whole monitoring period.
+
+The statistics are derived from additive counts (category counts, count, sum, sum of squares,
+min, max), so counts of new data can be merged with `add_counts` without a rescan of the history.
+"""
+import numpy as np
+import pandas as pd
+from settings import *
+from datacache import select_columns
+
+# Parameter -> (category column, category labels)
+PARAMETERS = {
+    'Temperature': ('Category_TEMP', labels_T_RH),
+    'RH': ('Category_RH', labels_T_RH),
+    'CO2': ('Category_CO2', labels_CO2_VOC),
+    'VOC': ('Category_VOC', labels_CO2_VOC),
+}
+PERIODS = ['BASELINE', 'MOBISTYLE']
+# Monitoring_Period of statistics over a user-defined date range
+CUSTOM = 'Custom'
+DESCRIPTIVE = ['min', 'mean', 'std', 'max']
+MOMENTS = ['count', 'sum', 'sumsq', 'min', 'max']
+COLUMNS = ['Room', 'Parameter', 'Monitoring_Period', 'Season', 'Statistic', 'Value']
+# Room data columns the statistics are computed from
+INPUT_COLUMNS = ['Room Status', 'Season'] + list(PARAMETERS) + [category for category, _ in PARAMETERS.values()]
+
+
+def category_codes(values, categories):
+    """Integer codes of `values` in `categories`, -1 for missing or unknown values."""
+    return pd.Categorical(values, categories=categories).codes.astype(np.int64)
+
+
+def room_counts(df, occupied=True, periods=PERIODS):
+    """Additive counts of one room, indexed by Parameter, Monitoring_Period, Season and Statistic."""
+    if occupied:
+        df = select_columns(df, ['Monitoring_Period'] + INPUT_COLUMNS, df['Room Status'].to_numpy() > 0)
+    seasons = sorted(pd.Series(df['Season']).dropna().unique())
+    groups = [(period, season) for period in periods for season in seasons + ['All']]
+
+    period = category_codes(df['Monitoring_Period'], periods)
+    season = category_codes(df['Season'], seasons)
+    valid = period >= 0
+    n_seasons = len(seasons) + 1
+    # Group code of every row and of the whole period ('All' season is the last one)
+    group = np.where(season >= 0, period * n_seasons + season, -1)[valid]
+    group_all = (period * n_seasons + n_seasons - 1)[valid]
+    by_season = group >= 0
+
+    tables = []
+    for parameter, (category_name, labels) in PARAMETERS.items():
+        n_labels = len(labels) + 1
+        codes = category_codes(df[category_name], labels)[valid]
+        codes[codes < 0] = len(labels)
+
+        counts = np.bincount(group_all * n_labels + codes, minlength=len(groups) * n_labels)
+        counts += np.bincount(group[by_season] * n_labels + codes[by_season], minlength=len(groups) * n_labels)
+        counts = counts.reshape(len(groups), n_labels)
+
+        values = pd.Series(df[parameter].to_numpy(dtype=float)[valid])
+        values = pd.DataFrame({'value': values, 'square': values ** 2})
+        aggregations = {'count': ('value', 'count'), 'sum': ('value', 'sum'), 'sumsq': ('square', 'sum'),
+                        'min': ('value', 'min'), 'max': ('value', 'max')}
+        moments = pd.concat([values[by_season].groupby(group[by_season]).agg(**aggregations),
+                             values.groupby(group_all).agg(**aggregations)]).reindex(range(len(groups)))
+        moments[['count', 'sum', 'sumsq']] = moments[['count', 'sum', 'sumsq']].fillna(0)
+
+        table = pd.DataFrame(np.hstack([counts, moments.loc[:, MOMENTS].to_numpy()]),
+                             index=pd.MultiIndex.from_tuples(groups, names=['Monitoring_Period', 'Season']),
+                             columns=pd.Index(labels + ['Missing data'] + MOMENTS, name='Statistic'))
+        table = pd.concat({parameter: table.stack(dropna=False)}, names=['Parameter'])
+        tables.append(table)
+    return pd.concat(tables).rename('Value')
+
+
+def add_counts(counts, other):
+    """Merge the counts of two disjoint sets of rows of the same room."""
+    index = counts.index.union(other.index)
+    counts, other = counts.reindex(index), other.reindex(index)
+    statistic = index.get_level_values('Statistic')
+    merged = counts.fillna(0) + other.fillna(0)
+    merged = merged.where(statistic != 'min', np.fmin(counts, other))
+    return merged.where(statistic != 'max', np.fmax(counts, other))
+
+
+def stats_from_counts(counts, room):
+    """Tidy statistics table of one room from its counts."""
+    tables = []
+    for parameter, (_, labels) in PARAMETERS.items():
+        table = counts.loc[parameter].unstack('Statistic')
+        labels = labels + ['Missing data']
+        with np.errstate(invalid='ignore', divide='ignore'):
+            pct = table.loc[:, labels].mul(100).div(table.loc[:, labels].sum(axis=1), axis=0).fillna(0)
+            n = table['count'].where(table['count'] > 0)
+            mean = table['sum'] / n
+            std = np.sqrt(((table['sumsq'] - table['sum'] * mean) / (n - 1)).clip(lower=0))
+        table = pct.assign(min=table['min'], mean=mean, std=std, max=table['max'])
+        table.columns.name = 'Statistic'
+        tables.append(pd.concat({parameter: table.stack(dropna=False)}, names=['Parameter']))
+
+    table = pd.concat(tables).rename('Value').reset_index()
+    table.insert(0, 'Room', room)
+    return table[COLUMNS]
+
+
+def room_stats(df, room, occupied=True):
+    """Tidy statistics table of one room."""
+    return stats_from_counts(room_counts(df, occupied), room)
+
+
+def comfort_stats(data_dct, occupied=True):
+    """Tidy statistics table of all rooms in a room -> DataFrame mapping."""
+    return pd.concat([room_stats(df, room, occupied) for room, df in data_dct.items()], ignore_index=True)
+
+
+def range_stats(data_dct, label=CUSTOM, occupied=True):
+    """Tidy statistics table of all rooms over one date range, with Monitoring_Period `label`."""
+    return pd.concat([stats_from_counts(room_counts(df.assign(Monitoring_Period=label), occupied, [label]), room)
+                      for room, df in data_dct.items()], ignore_index=True)
+
+
+def comfort_stats_from_counts(counts_dct):
+    """Tidy statistics table of all rooms in a room -> counts mapping."""
+    return pd.concat([stats_from_counts(counts, room) for room, counts in counts_dct.items()], ignore_index=True)
+
+
+def category_table(stats, room, parameter, period):
+    """Time distribution (%) in comfort categories, one row per season."""
+    labels = PARAMETERS[parameter][1] + ['Missing data']
+    mask = ((stats['Room'] == room) & (stats['Parameter'] == parameter) &
+            (stats['Monitoring_Period'] == period) & (stats['Season'] != 'All') & stats['Statistic'].isin(labels))
+    return stats[mask].pivot(index='Season', columns='Statistic', values='Value').loc[:, labels]
+
+
+def summary_table(stats, parameter, period, rooms=None):
+    """Time distribution (%) in comfort categories and descriptive statistics, one row per room."""
+    rooms = room_lst if rooms is None else rooms
+    labels = PARAMETERS[parameter][1] + ['Missing data'] + DESCRIPTIVE
+    mask = ((stats['Parameter'] == parameter) & (stats['Monitoring_Period'] == period) &
+            (stats['Season'] == 'All'))
+    return (stats[mask].pivot(index='Room', columns='Statistic', values='Value')
+            .reindex(index=rooms, columns=labels).round(1))
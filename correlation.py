@@ -0,0 +1,63 @@
+"""Spearman correlation matrices of the daily room data.
+
+The daily values of the occupied days are ranked once per monitoring period and season (and for
+the whole period), then the Pearson correlation of the ranks is computed for all variable pairs
+with a few matrix products. Missing values are left out pairwise; the ranks are taken over the
+valid values of each variable, so with missing values the result is close to, not exactly equal
+to, the pairwise Spearman coefficient of pandas. The matrices of all groups are kept in one table
+    index: Monitoring_Period, Season, Variable    columns: Variable
+where Season 'All' holds the whole monitoring period.
+"""
+import numpy as np
+import pandas as pd
+from settings import *
+from comfort_stats import PERIODS
+
+# Daily columns left out of the correlation matrices
+EXCLUDED = ['Room Status', 'Season', 'Monitoring_Period', 'Diffuse radiation', 'Window State Change']
+
+
+def masked_pearson(x):
+    """Pearson correlation of the columns of `x`, rows with missing values left out pairwise."""
+    valid = (~np.isnan(x)).astype(float)
+    x = np.nan_to_num(x)
+    n = valid.T @ valid
+    # sums[i, j]: sum of column i over the rows where column j is valid
+    sums = x.T @ valid
+    squares = (x ** 2).T @ valid
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = x.T @ x - sums * sums.T / n
+        var = squares - sums ** 2 / n
+        corr = cov / np.sqrt(var * var.T)
+    corr[n < 2] = np.nan
+    return np.clip(corr, -1, 1)
+
+
+def spearman_matrices(df_daily, occupied=True):
+    """Spearman matrices of every monitoring period and season, and of the whole periods."""
+    if occupied:
+        df_daily = df_daily[df_daily['Room Status'].to_numpy() > 0]
+    variables = [column for column in df_daily.select_dtypes('number') if column not in EXCLUDED]
+    keys = df_daily['Monitoring_Period'].astype(object), df_daily['Season'].astype(object)
+    values = df_daily[variables]
+
+    ranks = {(period, 'All'): values[keys[0] == period].rank() for period in PERIODS}
+    for (period, season), rows in values.groupby(list(keys)).indices.items():
+        ranks[(period, season)] = values.iloc[rows].rank()
+
+    tables = {group: pd.DataFrame(masked_pearson(rank.to_numpy(dtype=float)), index=variables, columns=variables)
+              for group, rank in sorted(ranks.items())}
+    return pd.concat(tables, names=['Monitoring_Period', 'Season', 'Variable'])
+
+
+def corr_matrix(corrs, period, season='All'):
+    """Correlation matrix of one monitoring period and season."""
+    return corrs.loc[(period, season)]
+
+
+def cross_room(corrs_dct, x, y, season='All'):
+    """Correlation of variables `x` and `y` in each room (rows) and monitoring period (columns)."""
+    return pd.DataFrame({period: {room_names[room_lst.index(room)]: corrs.loc[(period, season, x), y]
+                                  if (period, season, x) in corrs.index else np.nan
+                                  for room, corrs in corrs_dct.items()}
+                         for period in PERIODS})
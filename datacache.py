@@ -0,0 +1,324 @@
+"""Columnar binary cache of the ./Data files.
+
+The raw CSV/XLSX files are parsed once and stored as Feather files in ./Data/cache with the
+final column names and category dtypes already applied. A manifest keeps the mtime, size and
+hash of every source file, a cached file is rebuilt only when its source has changed or was
+converted by an older cache format.
+
+Room and outdoor data are stored compact: float32 sensor values, int8 occupancy and window flags
+and categorical columns with dictionaries shared by all rooms. Loaded frames with the same
+timestamps share one DatetimeIndex object.
+
+Cached files are uncompressed Arrow (Feather V2) files with missing float values stored as NaN, so
+they are memory-mapped: the numeric columns of a loaded frame are read-only views of the file,
+held once in the OS page cache for every session, server process and render worker. Frames of
+rooms with ingested batches are concatenated copies in memory. Aggregates read the columns of a
+loaded frame with `select_columns`, a row or column take on the frame itself would copy them.
+
+Convert all data files:
+    python datacache.py
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+from settings import *
+
+CACHE_DIR = os.path.join(DATA_DIR, 'cache')
+MANIFEST = os.path.join(CACHE_DIR, 'manifest.json')
+# Batches of new readings appended by ingest.py, one directory per dataset
+INGEST_DIR = os.path.join(DATA_DIR, 'ingest')
+# Version of the cached file layout, cached files of other versions are rebuilt
+FORMAT = 3
+
+# Occupancy and window columns, int8 unless they have missing values
+FLAGS = ['Room Status', 'Window State', 'Window State Change']
+# Category dictionaries shared by all rooms
+CATEGORIES = {
+    'Monitoring_Period': pd.CategoricalDtype(['BASELINE', 'MOBISTYLE']),
+    'Category_TEMP': pd.CategoricalDtype(labels_T_RH),
+    'Category_RH': pd.CategoricalDtype(labels_T_RH),
+    'Category_CO2': pd.CategoricalDtype(labels_CO2_VOC),
+    'Category_VOC': pd.CategoricalDtype(labels_CO2_VOC),
+}
+_indexes = {}
+
+
+# COMPACT TYPES
+def compact(df):
+    """Room or outdoor data with float32 values, int8 flags and shared category dictionaries."""
+    columns = {}
+    for column, dtype in df.dtypes.items():
+        if column in FLAGS and df[column].notna().all():
+            columns[column] = df[column].astype('int8')
+        elif column in CATEGORIES:
+            columns[column] = df[column].astype(object).astype(CATEGORIES[column])
+        elif column == 'Season' or dtype == object:
+            columns[column] = df[column].astype('category')
+        elif pd.api.types.is_float_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+            columns[column] = df[column].astype('float32')
+        else:
+            columns[column] = df[column]
+    return pd.DataFrame(columns, index=df.index)
+
+
+def shared_index(index):
+    """The DatetimeIndex object already in use with the same timestamps, or `index` itself."""
+    if not isinstance(index, pd.DatetimeIndex) or not len(index):
+        return index
+    key = (len(index), index[0], index[-1])
+    cached = _indexes.get(key)
+    if cached is not None and (cached is index or cached.equals(index)):
+        return cached
+    _indexes[key] = index
+    return index
+
+
+# SOURCE READERS
+def read_room_csv(room):
+    """Parse Data_{room}.csv the way the app expects it."""
+    columns = room_columns(room)
+    return compact(pd.read_csv(os.path.join(DATA_DIR, f'Data_{room}.csv'),
+                               usecols=list(columns) + ['Timestamp'],
+                               dtype=room_dtypes,
+                               parse_dates=True,
+                               index_col='Timestamp')
+                   .rename(columns=columns))
+
+
+def read_outdoor_csv():
+    df = pd.read_csv(os.path.join(DATA_DIR, 'outdoor_data.csv'), parse_dates=True, index_col='Timestamp')
+    df = df.rename(columns={'RH': 'Outdoor RH', 'Temperature': 'Outdoor Temperature'})
+    df.loc[BL_start: BL_end, 'Monitoring_Period'] = 'BASELINE'
+    df.loc[MS_start: MS_end, 'Monitoring_Period'] = 'MOBISTYLE'
+    return compact(df)
+
+
+def read_room_info():
+    return pd.read_excel(os.path.join(DATA_DIR, 'room_info.xlsx'), index_col='Room_ID', parse_dates=True)
+
+
+def read_hdd():
+    return pd.read_excel(os.path.join(DATA_DIR, 'HDDs_SL.xlsx'), index_col='Timestamp', parse_dates=True,
+                         usecols=[0, 1, 2], nrows=25)
+
+
+def read_categories():
+    return pd.read_excel(os.path.join(DATA_DIR, 'comfort_categories.xlsx'), index_col='Category')
+
+
+def datasets():
+    """Dataset name -> (source file, reader, index column)."""
+    dct = {f'Data_{room}': (f'Data_{room}.csv', lambda room=room: read_room_csv(room), 'Timestamp')
+           for room in room_lst}
+    dct.update({
+        'outdoor_data': ('outdoor_data.csv', read_outdoor_csv, 'Timestamp'),
+        'room_info': ('room_info.xlsx', read_room_info, 'Room_ID'),
+        'HDDs_SL': ('HDDs_SL.xlsx', read_hdd, 'Timestamp'),
+        'comfort_categories': ('comfort_categories.xlsx', read_categories, 'Category'),
+    })
+    return dct
+
+
+# MANIFEST
+def file_hash(path):
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def read_manifest():
+    try:
+        with open(MANIFEST) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_manifest(manifest):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp = f'{MANIFEST}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, MANIFEST)
+
+
+def cache_path(name):
+    return os.path.join(CACHE_DIR, f'{name}.feather')
+
+
+# ARROW FILES
+def write_feather(df, path):
+    """Write a frame to an uncompressed Feather file, float columns without a null bitmap."""
+    df = df.reset_index()
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    for i, column in enumerate(df):
+        if pd.api.types.is_float_dtype(df[column].dtype):
+            # NaN stays a value instead of a null, the column is read back without a copy
+            table = table.set_column(i, column, pa.array(df[column].to_numpy()))
+    tmp = f'{path}.{os.getpid()}.tmp'
+    # One record batch, a column split in chunks is copied when converted to pandas
+    feather.write_feather(table, tmp, compression='uncompressed', chunksize=max(len(df), 1))
+    os.replace(tmp, path)
+
+
+def read_feather(path, index_col):
+    """Memory-mapped frame of a Feather file, numeric columns are read-only views of the file."""
+    table = feather.read_table(path, memory_map=True)
+    df = table.drop([index_col]).to_pandas(split_blocks=True)
+    df.index = pd.Index(table.column(index_col).to_pandas(), name=index_col)
+    for column in CATEGORIES.keys() & set(df.columns):
+        df[column] = pd.Categorical.from_codes(df[column].cat.codes, dtype=CATEGORIES[column])
+    return df
+
+
+def is_fresh(name, manifest):
+    """Check the cached file of a dataset against its source.
+    The source is re-hashed only when its mtime or size differ from the manifest.
+    """
+    source = os.path.join(DATA_DIR, datasets()[name][0])
+    entry = manifest.get(name)
+    if entry is None or entry.get('format') != FORMAT or not os.path.exists(cache_path(name)):
+        return False
+    if not os.path.exists(source):
+        return True
+    stat = os.stat(source)
+    if entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+        return True
+    if entry['sha1'] == file_hash(source):
+        entry.update(mtime=stat.st_mtime, size=stat.st_size)
+        write_manifest(manifest)
+        return True
+    return False
+
+
+def batch_paths(name):
+    """Ingested batch files of a dataset in time order."""
+    return sorted(glob.glob(os.path.join(INGEST_DIR, name, '*.feather')))
+
+
+def version(name):
+    """Hash of the source file a dataset was built from and names of its ingested batches,
+    None if not converted yet.
+    """
+    sha1 = read_manifest().get(name, {}).get('sha1')
+    batches = [os.path.basename(path) for path in batch_paths(name)]
+    return ':'.join([sha1] + batches) if sha1 and batches else sha1
+
+
+def data_state():
+    """Fingerprint of all source files in the cache and paths of all ingested batches."""
+    manifest = read_manifest()
+    sources = hashlib.sha1(''.join(manifest[name]['sha1'] for name in sorted(manifest)).encode()).hexdigest()
+    return sources, sorted(glob.glob(os.path.join(INGEST_DIR, '*', '*.feather')))
+
+
+def data_version(state=None):
+    """Fingerprint of all source files in the cache and all ingested batches."""
+    sources, batches = state or data_state()
+    return hashlib.sha1(''.join([sources] + batches).encode()).hexdigest()
+
+
+# CONVERT / LOAD
+def convert(name):
+    source, reader, index_col = datasets()[name]
+    source = os.path.join(DATA_DIR, source)
+    df = reader()
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    write_feather(df, cache_path(name))
+
+    manifest = read_manifest()
+    stat = os.stat(source)
+    manifest[name] = {'source': source, 'mtime': stat.st_mtime, 'size': stat.st_size,
+                      'sha1': file_hash(source), 'index': index_col, 'format': FORMAT}
+    write_manifest(manifest)
+    return df
+
+
+def load(name):
+    """Load a dataset from the cache, (re)building it first if the source file has changed."""
+    if not is_fresh(name, read_manifest()):
+        convert(name)
+    df = read_feather(cache_path(name), datasets()[name][2])
+    df.index = shared_index(df.index)
+    return df
+
+
+def select_columns(df, columns, rows=None):
+    """New frame of some columns of a loaded frame, optionally of the rows of a boolean mask.
+    Columns are read one by one: a row or column take on a loaded frame consolidates its blocks in
+    place, which copies the memory-mapped columns to the heap of the process.
+    """
+    index = df.index if rows is None else df.index[rows]
+    return pd.DataFrame({column: df[column].array if rows is None else df[column].array[rows] for column in columns},
+                        index=index)
+
+
+def concat_frames(frames):
+    """Concatenate frames in time order, with the compact column types."""
+    df = compact(pd.concat(frames))
+    df.index = shared_index(df.index)
+    return df
+
+
+def load_batch(path):
+    return pd.read_feather(path).set_index('Timestamp')
+
+
+def load_room(room, batches=None):
+    """Room data including ingested batches, only those of the `batches` paths if given."""
+    df = load(f'Data_{room}')
+    batches = [load_batch(path) for path in batch_paths(f'Data_{room}') if batches is None or path in batches]
+    return concat_frames([df] + batches) if batches else df
+
+
+def load_outdoor():
+    return load('outdoor_data')
+
+
+def load_room_info():
+    return load('room_info')
+
+
+def load_hdd():
+    return load('HDDs_SL')
+
+
+def load_categories():
+    return load('comfort_categories')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert ./Data files to the columnar cache.')
+    parser.add_argument('names', nargs='*', help='datasets to convert (default: all)')
+    parser.add_argument('--force', action='store_true', help='rebuild even if the source is unchanged')
+    args = parser.parse_args()
+
+    for name in args.names or datasets():
+        if not os.path.exists(os.path.join(DATA_DIR, datasets()[name][0])):
+            print(f'{name:<20} missing source, skipped')
+            continue
+        if not args.force and is_fresh(name, read_manifest()):
+            print(f'{name:<20} up to date')
+            continue
+        start = time.perf_counter()
+        df = convert(name)
+        print(f'{name:<20} {len(df):>7} rows  {time.perf_counter() - start:6.2f} s')
+
+    for name in args.names or datasets():
+        if os.path.exists(cache_path(name)):
+            start = time.perf_counter()
+            load(name)
+            print(f'{name:<20} cached load {(time.perf_counter() - start) * 1000:6.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
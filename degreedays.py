@@ -0,0 +1,88 @@
+"""Heating and cooling degree-days computed from the outdoor temperature.
+
+A day adds (base - mean) heating degree-days (HDD) when its mean outdoor temperature is below the
+heating base temperature and (mean - base) cooling degree-days (CDD) when it is above the cooling
+base temperature. The daily means of the 15-minute Outdoor Temperature are computed once per data
+version, the monthly degree-days of a pair of base temperatures are then a few vectorized operations
+on about 750 days, cached per base temperature in the registry (`registry.degree_days`), fast enough
+for an interactive slider. Days without readings add no degree-days.
+
+Monthly degree-days of other base temperatures:
+    python degreedays.py --heating 16 --cooling 24
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+from settings import *
+
+# Base temperatures of the Eurostat degree-days, without its 15 / 24 degC day thresholds
+HEATING_BASE = 18.
+COOLING_BASE = 21.
+PERIODS = {'BASELINE': (BL_start, BL_end), 'MOBISTYLE': (MS_start, MS_end)}
+
+
+def daily_mean(outdoor):
+    """Daily mean outdoor temperature, NaN for days without readings."""
+    return outdoor['Outdoor Temperature'].astype('float64').resample('D').mean()
+
+
+def degree_days(daily, heating=HEATING_BASE, cooling=COOLING_BASE, start=BL_start, end=MS_end):
+    """Monthly HDDs and CDDs from the month of `start` to the month of `end` (included),
+    the months and columns of HDDs_SL.xlsx.
+    """
+    values = daily.to_numpy()
+    seen = ~np.isnan(values)
+    months = (daily.index.year * 12 + daily.index.month - 1).to_numpy()
+    first, last = pd.Timestamp(start), pd.Timestamp(end)
+    index = pd.date_range(first.to_period('M').to_timestamp(), last.to_period('M').to_timestamp(), freq='MS')
+    # Month position of each day, days outside the range are dropped
+    position = months - (first.year * 12 + first.month - 1)
+    keep = seen & (position >= 0) & (position < len(index))
+    values, position = values[keep], position[keep]
+    table = pd.DataFrame({
+        'HDDs': np.bincount(position, np.clip(heating - values, 0, None), len(index)),
+        'CDDs': np.bincount(position, np.clip(values - cooling, 0, None), len(index)),
+    }, index=index.rename('Timestamp'))
+    return table.round(1)
+
+
+def period_totals(dd):
+    """Total HDDs and CDDs of the BASELINE and MOBISTYLE monitoring periods."""
+    return pd.DataFrame({period: dd[start:pd.Timestamp(end) - pd.Timedelta(1)].sum()
+                         for period, (start, end) in PERIODS.items()}).T.rename_axis('Monitoring_Period')
+
+
+def normalized_comparison(dd, index):
+    """Window opening of the monitoring periods normalized by the period HDDs.
+    A milder MOBISTYLE winter has fewer HDDs, the openings and hours open per 100 HDD compare
+    the periods without the difference in weather. `index` is the episode index of a room.
+    """
+    table = period_totals(dd)
+    episodes = index['episodes']
+    for period, (start, end) in PERIODS.items():
+        rows = episodes[(episodes['Month'] >= start) & (episodes['Month'] < end)]
+        table.loc[period, 'Openings'] = rows['Opened'].sum()
+        table.loc[period, 'Open [h]'] = rows['Duration [h]'].sum()
+    hdd = table['HDDs'].where(table['HDDs'] > 0)
+    table['Openings per 100 HDD'] = table['Openings'] / hdd * 100
+    table['Open [h] per 100 HDD'] = table['Open [h]'] / hdd * 100
+    table.loc['Change [%]'] = (table.loc['MOBISTYLE'] / table.loc['BASELINE'].where(table.loc['BASELINE'] != 0)
+                               - 1) * 100
+    return table.round(1)
+
+
+def main():
+    from datacache import load_outdoor
+    parser = argparse.ArgumentParser(description='Monthly heating and cooling degree-days.')
+    parser.add_argument('--heating', type=float, default=HEATING_BASE, help='heating base temperature')
+    parser.add_argument('--cooling', type=float, default=COOLING_BASE, help='cooling base temperature')
+    args = parser.parse_args()
+
+    dd = degree_days(daily_mean(load_outdoor()), args.heating, args.cooling)
+    print(dd.to_string())
+    print(period_totals(dd).to_string())
+
+
+if __name__ == '__main__':
+    main()
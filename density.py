@@ -0,0 +1,50 @@
+"""2-D density grids of office vs outdoor temperature.
+
+Counts of 15-minute samples on a fixed grid over EXTENT are computed for each monitoring period
+and season (and 'All' seasons) with one np.bincount. Grids are additive: the grid of new data is
+simply added to the cached grid with `add_grids`.
+"""
+import numpy as np
+import pandas as pd
+from settings import *
+from datacache import select_columns
+
+EXTENT = (15, 30, -5, 35)
+BINS = (20, 20)
+PERIODS = ['BASELINE', 'MOBISTYLE']
+
+
+def bin_index(values, start, stop, n):
+    """Bin index of each value on `n` equal bins from start to stop, -1 outside."""
+    index = np.floor((values - start) / (stop - start) * n)
+    index[values == stop] = n - 1
+    return np.where((index >= 0) & (index < n), index, -1).astype(np.int64)
+
+
+def density_grids(data, outdoor_data, x='Temperature', y='Outdoor Temperature'):
+    """Dict (period, season) -> counts array of shape BINS, with season 'All' for the whole period."""
+    df = select_columns(data, [x, 'Monitoring_Period', 'Season'])
+    df[y] = outdoor_data[y].reindex(df.index)
+    seasons = sorted(pd.Series(df['Season']).dropna().unique())
+    groups = [(period, season) for period in PERIODS for season in seasons + ['All']]
+    n_cells = BINS[0] * BINS[1]
+
+    ix = bin_index(df[x].to_numpy(dtype=float), EXTENT[0], EXTENT[1], BINS[0])
+    iy = bin_index(df[y].to_numpy(dtype=float), EXTENT[2], EXTENT[3], BINS[1])
+    period = pd.Categorical(df['Monitoring_Period'], categories=PERIODS).codes.astype(np.int64)
+    season = pd.Categorical(df['Season'], categories=seasons).codes.astype(np.int64)
+    cell = ix * BINS[1] + iy
+    valid = (ix >= 0) & (iy >= 0) & (period >= 0)
+
+    n_seasons = len(seasons) + 1
+    group_all = period * n_seasons + n_seasons - 1
+    counts = np.bincount((group_all * n_cells + cell)[valid], minlength=len(groups) * n_cells)
+    by_season = valid & (season >= 0)
+    counts += np.bincount(((period * n_seasons + season) * n_cells + cell)[by_season],
+                          minlength=len(groups) * n_cells)
+    return dict(zip(groups, counts.reshape(len(groups), *BINS)))
+
+
+def add_grids(grids, other):
+    """Sum of two grid dicts."""
+    return {key: grids.get(key, 0) + other.get(key, 0) for key in set(grids) | set(other)}
@@ -0,0 +1,98 @@
+"""Window-opening episodes of each room.
+
+An episode is a run of consecutive samples with an open window, found with a run-length encoding of
+Window State. Runs are split at month boundaries, so monthly rollups are exact; the part of a run
+in the next month is an episode with Opened False. For each episode the index keeps
+    Start, End, Samples, Duration [h], Opened, Occupied [%], Monitoring_Period, Month
+    and the CO2 and Temperature at the start and the end of the episode and their change
+together with the number of window samples of each month. Monthly openings, time open and per
+opening statistics come from this small table, new readings are merged with `add_episodes`.
+"""
+import numpy as np
+import pandas as pd
+
+PARAMETERS = ['CO2', 'Temperature']
+COLUMNS = ['Start', 'End', 'Samples', 'Duration [h]', 'Opened', 'Occupied [%]', 'Monitoring_Period', 'Month'] + [
+    f'{parameter} {point}' for parameter in PARAMETERS for point in ('start', 'end', 'change')]
+
+
+def runs(is_open, index):
+    """First and last position of each run of open samples, runs are split at gaps and months."""
+    step = np.median(np.diff(index.asi8)) if len(index) > 1 else 0
+    month = (index.year * 12 + index.month).to_numpy()
+    follows = np.zeros(len(index), dtype=bool)
+    follows[1:] = is_open[1:] & is_open[:-1] & (month[1:] == month[:-1]) & (np.diff(index.asi8) == step)
+    starts = np.flatnonzero(is_open & ~follows)
+    ends = np.flatnonzero(is_open & ~np.append(follows[1:], False))
+    return starts, ends, step
+
+
+def episodes(df):
+    """Episodes of open window of room data."""
+    is_open = df['Window State'].to_numpy(dtype=float) == 1
+    starts, ends, step = runs(is_open, df.index)
+    occupied = np.append(0, np.cumsum(df['Room Status'].to_numpy(dtype=float) > 0))
+    samples = ends - starts + 1
+    table = pd.DataFrame({
+        'Start': df.index[starts],
+        'End': df.index[ends],
+        'Samples': samples,
+        'Duration [h]': samples * step / 3.6e12,
+        'Opened': df['Window State Change'].to_numpy(dtype=float)[starts] == 1,
+        'Occupied [%]': (occupied[ends + 1] - occupied[starts]) / samples * 100,
+        'Monitoring_Period': df['Monitoring_Period'].astype(object).to_numpy()[starts],
+        'Month': df.index[starts].to_period('M').to_timestamp(),
+    })
+    for parameter in PARAMETERS:
+        values = df[parameter].to_numpy(dtype=float)
+        table[f'{parameter} start'] = values[starts]
+        table[f'{parameter} end'] = values[ends]
+        table[f'{parameter} change'] = values[ends] - values[starts]
+    return table[COLUMNS]
+
+
+def episode_index(df):
+    """Episodes and monthly number of window samples of room data."""
+    return {'episodes': episodes(df), 'samples': df['Window State'].notna().resample('MS').sum()}
+
+
+def add_episodes(index, other):
+    """Merge the index of readings that follow the indexed readings.
+    A run that continues over the boundary of the two sets of readings is joined into one episode.
+    """
+    old, new = index['episodes'], other['episodes']
+    if len(old) and len(new) and not new['Opened'].iat[0] and new['Month'].iat[0] == old['Month'].iat[-1]:
+        last, first = old.iloc[-1], new.iloc[0]
+        step = pd.Timedelta(hours=last['Duration [h]'] / last['Samples'])
+        if first['Start'] - last['End'] == step:
+            joined = last.copy()
+            joined['End'] = first['End']
+            joined['Samples'] = last['Samples'] + first['Samples']
+            joined['Duration [h]'] = last['Duration [h]'] + first['Duration [h]']
+            joined['Occupied [%]'] = (last['Occupied [%]'] * last['Samples'] +
+                                      first['Occupied [%]'] * first['Samples']) / joined['Samples']
+            for parameter in PARAMETERS:
+                joined[f'{parameter} end'] = first[f'{parameter} end']
+                joined[f'{parameter} change'] = first[f'{parameter} end'] - last[f'{parameter} start']
+            old = pd.concat([old.iloc[:-1], joined.to_frame().T.astype(old.dtypes.to_dict())])
+            new = new.iloc[1:]
+    return {'episodes': pd.concat([old, new], ignore_index=True),
+            'samples': index['samples'].add(other['samples'], fill_value=0).astype(np.int64).sort_index()}
+
+
+def window_counts(index):
+    """Monthly window openings, sum of open window samples and number of window samples."""
+    grouped = index['episodes'].groupby('Month')
+    counts = pd.DataFrame({'Openings': grouped['Opened'].sum(), 'Open': grouped['Samples'].sum()})
+    counts = counts.reindex(index['samples'].index, fill_value=0).astype(np.int64)
+    counts['Samples'] = index['samples']
+    return counts.rename_axis('Timestamp')
+
+
+def episode_summary(index, by='Monitoring_Period'):
+    """Number of openings and median duration, occupancy and CO2 and temperature change per opening."""
+    opened = index['episodes'][index['episodes']['Opened']]
+    grouped = opened.groupby(by)
+    table = grouped[['Duration [h]', 'Occupied [%]'] + [f'{parameter} change' for parameter in PARAMETERS]].median()
+    table.insert(0, 'Openings', grouped.size())
+    return table.round(2)
@@ -0,0 +1,155 @@
+"""Cache of rendered figures.
+
+A figure is identified by its plot function, its non-data arguments (room, parameter, period, ...)
+and a hash of the contents of its DataFrame, array and dict arguments, so the figures of rooms
+whose data did not change keep their key when other data changes. Data arguments above
+FINGERPRINT_ROWS rows are not hashed, the key then includes the data version. Rendered PNG/SVG
+bytes are kept in memory with LRU eviction above MOBISTYLE_FIGURE_CACHE_MB (default 64 MB). When
+MOBISTYLE_FIGURE_CACHE_DIR is set, rendered figures are also written to and read from that directory.
+"""
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import instrument
+
+MAX_MB = float(os.environ.get('MOBISTYLE_FIGURE_CACHE_MB', 64))
+CACHE_DIR = os.environ.get('MOBISTYLE_FIGURE_CACHE_DIR')
+
+# Data arguments, represented by a hash of their contents in the figure key
+DATA_TYPES = (pd.DataFrame, pd.Series, np.ndarray, dict)
+# Larger data arguments are represented by the data version
+FINGERPRINT_ROWS = 100_000
+# Same output as st.pyplot
+SAVEFIG_KWARGS = {'bbox_inches': 'tight', 'dpi': 200}
+
+
+def fingerprint(arg):
+    """Hash of the contents of a data argument, None if it is too large or cannot be hashed."""
+    if isinstance(arg, dict):
+        items = sorted(((repr(key), fingerprint(value)) for key, value in arg.items()))
+        if any(digest is None for _, digest in items):
+            return None
+        return hashlib.sha1(repr(items).encode()).hexdigest()
+    if (len(arg) if getattr(arg, 'ndim', 0) else 1) > FINGERPRINT_ROWS:
+        return None
+    sha = hashlib.sha1()
+    try:
+        if isinstance(arg, np.ndarray):
+            sha.update(f'{arg.dtype}{arg.shape}'.encode())
+            sha.update(pd.util.hash_array(arg.ravel()).tobytes())
+        else:
+            columns = arg.columns if isinstance(arg, pd.DataFrame) else [arg.name]
+            sha.update(repr((list(columns), [str(dtype) for dtype in np.atleast_1d(arg.dtypes)])).encode())
+            sha.update(pd.util.hash_pandas_object(arg, index=True).to_numpy().tobytes())
+    except TypeError:
+        return None
+    return sha.hexdigest()
+
+
+def figure_key(func, args, kwargs, version, fmt):
+    """Hash of plot function name, arguments and image format. Data arguments are hashed by contents,
+    the data version is part of the key only for those too large to hash.
+    """
+    parts = [f'{func.__module__}.{func.__name__}', fmt]
+    hashed = True
+    for name, arg in [(None, arg) for arg in args] + sorted(kwargs.items()):
+        if isinstance(arg, DATA_TYPES):
+            digest = fingerprint(arg)
+            hashed = hashed and digest is not None
+            parts.append(f'{name}={digest or type(arg).__name__}')
+        else:
+            parts.append(f'{name}={arg!r}')
+    if not hashed:
+        parts.append(str(version))
+    return hashlib.sha1('|'.join(parts).encode()).hexdigest()
+
+
+def render_figure(fig, fmt='png'):
+    """Rendered bytes of a matplotlib Figure or seaborn grid, the figure is closed afterwards."""
+    import matplotlib.pyplot as plt
+    fig = getattr(fig, 'fig', fig)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=fmt, **SAVEFIG_KWARGS)
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+class FigureCache:
+    def __init__(self, max_mb=MAX_MB, cache_dir=CACHE_DIR):
+        self.max_bytes = max_mb * 2 ** 20
+        self.cache_dir = cache_dir
+        self.hits, self.misses = 0, 0
+        self._items = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.RLock()
+
+    def _path(self, key, fmt):
+        return os.path.join(self.cache_dir, f'{key}.{fmt}')
+
+    def get(self, key, fmt='png'):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+        if self.cache_dir and os.path.exists(self._path(key, fmt)):
+            with open(self._path(key, fmt), 'rb') as f:
+                data = f.read()
+            self._store(key, data)
+            return data
+        return None
+
+    def put(self, key, data, fmt='png'):
+        self._store(key, data)
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp = f'{self._path(key, fmt)}.{os.getpid()}.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, self._path(key, fmt))
+
+    def _store(self, key, data):
+        with self._lock:
+            if key in self._items:
+                self._nbytes -= len(self._items.pop(key))
+            self._items[key] = data
+            self._nbytes += len(data)
+            while len(self._items) > 1 and self._nbytes > self.max_bytes:
+                self._nbytes -= len(self._items.popitem(last=False)[1])
+
+    def lookup(self, func, args, kwargs, version='', fmt='png'):
+        """Key and cached bytes of func(*args, **kwargs), None on a cache miss."""
+        key = figure_key(func, args, kwargs, version, fmt)
+        data = self.get(key, fmt)
+        if data is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return key, data
+
+    def render(self, func, *args, version='', fmt='png', **kwargs):
+        """Rendered bytes of func(*args, **kwargs), plotted only on a cache miss."""
+        key, data = self.lookup(func, args, kwargs, version, fmt)
+        if data is None:
+            with instrument.stage(f'plot {func.__name__}'):
+                fig = func(*args, **kwargs)
+            with instrument.stage(f'savefig {func.__name__}'):
+                data = render_figure(fig, fmt)
+            self.put(key, data, fmt)
+        return data
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._nbytes = 0
+
+    def report(self):
+        return {'Figures': len(self._items), 'Size [MB]': round(self._nbytes / 2 ** 20, 3),
+                'Hits': self.hits, 'Misses': self.misses}
+
+
+figure_cache = FigureCache()
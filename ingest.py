@@ -0,0 +1,114 @@
+"""Append-only ingestion of new 15-minute readings of a room.
+
+A batch is stored next to the converted room data in ./Data/ingest/Data_{room}. Only the new rows
+are categorized, and the aggregates loaded in the registry (comfort category counts, daily sums,
+window-opening episodes, density grids and the box plots of the affected months) are updated
+from the new rows instead of being recomputed from the whole history. A running app applies the
+new batch files the same way on its next registry sync. Readings must lie in the BASELINE or
+MOBISTYLE monitoring period, the aggregates have no rows for others.
+
+Append readings from a CSV file with a Timestamp column and raw or app column names:
+    python ingest.py R3N0808 readings.csv
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+import datacache
+import partitions
+from settings import *
+from registry import registry
+from comfort_stats import PARAMETERS, room_counts, add_counts
+from rollups import daily_sums, add_sums, monitoring_period, update_box_stats
+from density import density_grids, add_grids
+from episodes import episode_index, add_episodes
+
+BINS = {'Temperature': bins_TEMP, 'RH': bins_RH, 'CO2': bins_CO2, 'VOC': bins_VOC}
+
+
+def season_by_month(history):
+    """Most frequent Season of each calendar month in the room history."""
+    season = history['Season'].astype(object)
+    return season.groupby(history.index.month).agg(lambda x: x.mode().iat[0] if x.notna().any() else np.nan)
+
+
+def prepare_batch(room, batch, history):
+    """Add Monitoring_Period, Season, Window State Change and comfort categories to new readings."""
+    batch = batch.rename(columns=room_columns(room)).sort_index()
+    batch = batch[~batch.index.duplicated(keep='last')]
+    batch.index = pd.DatetimeIndex(batch.index, name='Timestamp')
+    if len(history) and batch.index[0] <= history.index[-1]:
+        raise ValueError(f'Readings of {room} up to {history.index[-1]} are already ingested')
+
+    batch['Monitoring_Period'] = monitoring_period(batch.index)
+    outside = batch.index[batch['Monitoring_Period'].isna()]
+    if len(outside):
+        raise ValueError(f'Readings of {room} at {outside[0]} are outside the monitoring periods '
+                         f'({BL_start} - {MS_end})')
+    if 'Season' not in batch:
+        batch['Season'] = batch.index.month.map(season_by_month(history))
+    if 'Window State Change' not in batch:
+        previous = history['Window State'].iloc[-1] if len(history) else np.nan
+        batch['Window State Change'] = np.diff(batch['Window State'].to_numpy(dtype=float), prepend=previous)
+    for parameter, (category_name, labels) in PARAMETERS.items():
+        batch[category_name] = pd.cut(batch[parameter], BINS[parameter], labels=labels)
+
+    return datacache.compact(batch.reindex(columns=history.columns))
+
+
+def append_batch(room, batch):
+    """Store a batch of new readings and apply it to the loaded datasets of the room."""
+    name = f'Data_{room}'
+    registry.sync()
+    new = prepare_batch(room, batch, registry.get(name))
+
+    os.makedirs(os.path.join(datacache.INGEST_DIR, name), exist_ok=True)
+    new.reset_index().to_feather(os.path.join(datacache.INGEST_DIR, name, f'{new.index[0]:%Y%m%dT%H%M%S}.feather'))
+    partitions.append(room, new)
+    registry.sync()
+    return new
+
+
+def apply_batch(room, new):
+    """Update the loaded datasets of a room with the rows of a stored batch, called by registry.sync."""
+    name = f'Data_{room}'
+    outdoor_data = registry.get('outdoor_data')
+    registry.update(name, lambda df: datacache.concat_frames([df, new]))
+    registry.update(f'comfort_counts_{room}', lambda counts: add_counts(counts, room_counts(new)))
+    registry.update(f'daily_sums_{room}', lambda sums: add_sums(sums, daily_sums(new, outdoor_data)))
+    registry.update(f'episodes_{room}', lambda index: add_episodes(index, episode_index(new)))
+    registry.update(f'density_{room}', lambda grids: add_grids(grids, density_grids(new, outdoor_data)))
+    registry.evict('comfort_stats')
+    registry.evict('portfolio')
+    registry.evict(f'comfort_arrays_{room}')
+    registry.evict_prefix('what_if_')
+    registry.evict(f'daily_{room}')
+    registry.evict(f'corr_{room}')
+    registry.evict(f'window_{room}')
+    registry.evict('correlations')
+    registry.evict_prefix(f'series_{room}_')
+    registry.evict_prefix(f'period_stats_{room}_')
+
+    # Box plots: only the (period, month) groups of the new rows are computed again
+    def update_box(stats):
+        df = registry.get(name)
+        keys = pd.MultiIndex.from_arrays([monitoring_period(df.index), df.index.month])
+        new_keys = pd.MultiIndex.from_arrays([new['Monitoring_Period'].astype(object), new.index.month])
+        return update_box_stats(stats, df[keys.isin(new_keys)], room)
+    registry.update('box_stats', update_box)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Append new readings of a room.')
+    parser.add_argument('room', choices=room_lst)
+    parser.add_argument('path', help='CSV file with a Timestamp column')
+    args = parser.parse_args()
+
+    batch = pd.read_csv(args.path, parse_dates=True, index_col='Timestamp')
+    new = append_batch(args.room, batch)
+    print(f'{len(new)} readings of {args.room} appended, {new.index[0]} - {new.index[-1]}')
+
+
+if __name__ == '__main__':
+    main()
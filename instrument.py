@@ -0,0 +1,170 @@
+"""Stage timing and memory instrumentation.
+
+Enabled with MOBISTYLE_PROFILE=1. Each stage records its wall time, peak traced memory (tracemalloc)
+and the number of rows of its result. tracemalloc traces the whole process, so the peak of a stage
+includes what other sessions and threads allocated meanwhile. The stages of one app run are collected in a run, shown in
+the sidebar debug panel and appended to a JSON lines log (MOBISTYLE_PROFILE_LOG) with one record
+per stage. Tracing memory slows the app down, so profile runs are slower than normal runs.
+When disabled, `stage` returns a shared no-op object and `call` calls the function.
+
+Aggregate the log of all sessions:
+    python instrument.py [log file]
+"""
+import argparse
+import json
+import os
+import threading
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+ENABLED = os.environ.get('MOBISTYLE_PROFILE', '') not in ('', '0')
+LOG_PATH = os.environ.get('MOBISTYLE_PROFILE_LOG', './Results/Profiles/profile.jsonl')
+COLUMNS = ['stage', 'seconds', 'peak_mb', 'rows']
+# Report labels of the log columns, the peak is of the whole process
+LABELS = {'seconds': 'seconds', 'peak_mb': 'process peak [MB]', 'rows': 'rows'}
+
+_local = threading.local()
+_log_lock = threading.Lock()
+# Without reset_peak (Python < 3.9) the peak is the highest traced memory since the start
+_reset_peak = getattr(tracemalloc, 'reset_peak', lambda: None)
+
+
+def n_rows(obj):
+    """Number of rows of a DataFrame, Series or array, None for other objects."""
+    if isinstance(obj, (pd.DataFrame, pd.Series)) or (isinstance(obj, np.ndarray) and obj.ndim):
+        return len(obj)
+    return None
+
+
+def _stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+class Stage:
+    def __init__(self, name):
+        self.name = name
+        self.rows = None
+        self.peak = 0
+
+    def __enter__(self):
+        current, peak = tracemalloc.get_traced_memory()
+        self.base = current
+        # The peak so far belongs to the enclosing stage, keep it before the reset
+        if _stack():
+            _stack()[-1].peak = max(_stack()[-1].peak, peak)
+        _reset_peak()
+        # Records are added on entry, so inner stages follow the stage they belong to
+        self.record = {'stage': self.name, 'depth': len(_stack())}
+        run = getattr(_local, 'run', None)
+        if run is not None:
+            run['stages'].append(self.record)
+        _stack().append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        peak = max(tracemalloc.get_traced_memory()[1], self.peak)
+        _stack().pop()
+        # The peak of a stage includes the peaks of its inner stages
+        if _stack():
+            _stack()[-1].peak = max(_stack()[-1].peak, peak)
+        self.record.update(seconds=seconds, peak_mb=(peak - self.base) / 2 ** 20, rows=self.rows)
+        return False
+
+
+class NullStage:
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+NULL_STAGE = NullStage()
+
+
+def stage(name):
+    """Context manager timing the stage `name`, set `.rows` on it to record a row count."""
+    if not ENABLED:
+        return NULL_STAGE
+    return Stage(name)
+
+
+def call(name, func, *args, **kwargs):
+    """func(*args, **kwargs) timed as the stage `name`, rows are taken from the result."""
+    if not ENABLED:
+        return func(*args, **kwargs)
+    with Stage(name) as record:
+        result = func(*args, **kwargs)
+        record.rows = n_rows(result)
+    return result
+
+
+def start_run(page):
+    """Start collecting the stages of one app run in this thread."""
+    if ENABLED:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _local.run = {'run': uuid.uuid4().hex, 'page': page, 'time': datetime.now().isoformat(timespec='seconds'),
+                      'stages': []}
+        _local.last = None
+
+
+def end_run():
+    """Finish the run of this thread and append its stages to the log."""
+    run = getattr(_local, 'run', None)
+    if run is None:
+        return
+    _local.run, _local.last = None, run
+    os.makedirs(os.path.dirname(LOG_PATH) or '.', exist_ok=True)
+    with _log_lock, open(LOG_PATH, 'a') as f:
+        for record in run['stages']:
+            f.write(json.dumps(dict(record, run=run['run'], page=run['page'], time=run['time'])) + '\n')
+
+
+def report():
+    """Stages of the current (or last finished) run of this thread."""
+    run = getattr(_local, 'run', None) or getattr(_local, 'last', None)
+    if run is None:
+        return pd.DataFrame(columns=COLUMNS).set_index('stage').rename(columns=LABELS)
+    df = pd.DataFrame(run['stages'], columns=COLUMNS + ['depth'])
+    df['stage'] = ['  ' * depth + name for name, depth in zip(df['stage'], df['depth'])]
+    return df[COLUMNS].set_index('stage').rename(columns=LABELS).round(3)
+
+
+def aggregate(path=LOG_PATH):
+    """Number of runs, median and 95th percentile of time and peak memory per stage in a log."""
+    df = pd.read_json(path, lines=True)
+    grouped = df.groupby('stage')
+    return pd.DataFrame({
+        'runs': grouped['run'].nunique(),
+        'median [s]': grouped['seconds'].median(),
+        'p95 [s]': grouped['seconds'].quantile(.95),
+        'median process peak [MB]': grouped['peak_mb'].median(),
+        'max process peak [MB]': grouped['peak_mb'].max(),
+        'rows': grouped['rows'].max(),
+    }).sort_values('p95 [s]', ascending=False).round(3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Aggregate the profile log of the app.')
+    parser.add_argument('path', nargs='?', default=LOG_PATH)
+    args = parser.parse_args()
+    print(aggregate(args.path).to_string())
+
+
+if __name__ == '__main__':
+    main()
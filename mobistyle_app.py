@@ -1,17 +1,21 @@
+import importlib
+
 import streamlit as st
-import home
-import room
+import warmup
 
 
 def main():
+    warmup.start()
+
     # NAVIGATION
+    # Page modules are imported on first use, the Home page does not load the plotting modules
     pages = {
-        "Home": home,
-        "Room Selection": room
+        "Home": 'home',
+        "Room Selection": 'room'
     }
     st.sidebar.title('Navigation')
     selection = st.sidebar.radio('Go to', list(pages.keys()))
-    page = pages[selection]
+    page = importlib.import_module(pages[selection])
 
     # with st.spinner(f'Loading {selection} ...'):
     page.app()
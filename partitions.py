@@ -0,0 +1,152 @@
+"""Room data partitioned by room and month.
+
+The readings of a room (including ingested batches) are stored in one Feather file per month in
+./Data/cache/partitions/{room}/{YYYY-MM}.feather. A query reads only the months of its date range
+and only the requested columns, so the cost of a query depends on the range, not on the length of
+the history. A manifest keeps the data version each room was partitioned from; a room is
+partitioned again when its source file has changed, ingested batches rewrite only their months.
+
+Partition all rooms:
+    python partitions.py
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import datacache
+from settings import *
+
+PARTITION_DIR = os.path.join(datacache.CACHE_DIR, 'partitions')
+MANIFEST = os.path.join(PARTITION_DIR, 'manifest.json')
+
+
+# MANIFEST
+def read_manifest():
+    try:
+        with open(MANIFEST) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_manifest(manifest):
+    os.makedirs(PARTITION_DIR, exist_ok=True)
+    tmp = f'{MANIFEST}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, MANIFEST)
+
+
+def partition_path(room, month):
+    return os.path.join(PARTITION_DIR, room, f'{month}.feather')
+
+
+def is_fresh(room, manifest):
+    entry = manifest.get(room)
+    return (entry is not None and entry.get('format') == datacache.FORMAT
+            and entry['version'] == datacache.version(f'Data_{room}'))
+
+
+# WRITE
+def split_months(df):
+    """Month 'YYYY-MM' -> rows of that month, for time ordered data."""
+    if not len(df):
+        return {}
+    codes = (df.index.year * 12 + df.index.month - 1).to_numpy()
+    bounds = np.flatnonzero(np.diff(codes)) + 1
+    return {f'{code // 12}-{code % 12 + 1:02d}': df.iloc[start:stop]
+            for code, start, stop in zip(codes[np.append(0, bounds)], np.append(0, bounds), np.append(bounds, len(df)))}
+
+
+def write_months(room, df):
+    os.makedirs(os.path.join(PARTITION_DIR, room), exist_ok=True)
+    for month, rows in split_months(df).items():
+        tmp = f'{partition_path(room, month)}.{os.getpid()}.tmp'
+        rows.reset_index().to_feather(tmp)
+        os.replace(tmp, partition_path(room, month))
+
+
+def partition(room):
+    """Write all monthly partitions of a room."""
+    df = datacache.load_room(room)
+    manifest = read_manifest()
+    for month in manifest.get(room, {}).get('months', []):
+        if os.path.exists(partition_path(room, month)):
+            os.remove(partition_path(room, month))
+    write_months(room, df)
+    manifest[room] = {'version': datacache.version(f'Data_{room}'), 'format': datacache.FORMAT,
+                      'months': sorted(split_months(df))}
+    write_manifest(manifest)
+    return df
+
+
+def append(room, new):
+    """Rewrite the months of new readings that follow the partitioned readings of a room."""
+    manifest = read_manifest()
+    entry = manifest.get(room)
+    if entry is None or entry.get('format') != datacache.FORMAT:
+        return
+    months = split_months(new)
+    for month, rows in months.items():
+        if month in entry['months']:
+            months[month] = pd.concat([read_month(room, month), rows])
+    write_months(room, datacache.compact(pd.concat(list(months.values()))))
+    entry.update(version=datacache.version(f'Data_{room}'), months=sorted(set(entry['months']) | set(months)))
+    write_manifest(manifest)
+
+
+# QUERY
+def read_month(room, month, columns=None):
+    columns = None if columns is None else ['Timestamp'] + list(columns)
+    return pd.read_feather(partition_path(room, month), columns=columns).set_index('Timestamp')
+
+
+def empty_room(room, columns=None):
+    """Readings of a room without rows, with the columns and dtypes of the memory-mapped room data."""
+    df = datacache.load(f'Data_{room}')
+    return datacache.select_columns(df, df.columns if columns is None else columns, np.zeros(len(df), dtype=bool))
+
+
+def read_room(room, start=None, end=None, columns=None):
+    """Readings of a room from `start` (included) to `end` (excluded), optionally of some columns only."""
+    manifest = read_manifest()
+    if not is_fresh(room, manifest):
+        partition(room)
+        manifest = read_manifest()
+    first = f'{pd.Timestamp(start):%Y-%m}' if start is not None else ''
+    last = f'{pd.Timestamp(end) - pd.Timedelta(1):%Y-%m}' if end is not None else '9999-99'
+    months = [month for month in manifest[room]['months'] if first <= month <= last]
+    if not months:
+        return empty_room(room, columns)
+    df = datacache.compact(pd.concat([read_month(room, month, columns) for month in months]))
+    first = df.index.searchsorted(pd.Timestamp(start)) if start is not None else 0
+    last = df.index.searchsorted(pd.Timestamp(end)) if end is not None else len(df)
+    return df.iloc[first:last]
+
+
+def query(start=None, end=None, rooms=None, columns=None):
+    """Room -> readings from `start` (included) to `end` (excluded) of the requested columns."""
+    rooms = room_lst if rooms is None else rooms
+    return {room: read_room(room, start, end, columns) for room in rooms}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Partition the room data by month.')
+    parser.add_argument('rooms', nargs='*', help='rooms to partition (default: all)')
+    parser.add_argument('--force', action='store_true', help='rebuild even if the data is unchanged')
+    args = parser.parse_args()
+
+    for room in args.rooms or room_lst:
+        if not args.force and is_fresh(room, read_manifest()):
+            print(f'{room:<10} up to date')
+            continue
+        start = time.perf_counter()
+        df = partition(room)
+        print(f'{room:<10} {len(df):>7} rows  {len(split_months(df)):>3} months  {time.perf_counter() - start:6.2f} s')
+
+
+if __name__ == '__main__':
+    main()
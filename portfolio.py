@@ -0,0 +1,58 @@
+"""Portfolio summary of all rooms and buildings.
+
+One row per room with its building, the share of time outside the comfort categories I-II
+(discomfort) of every parameter and a comfort score, the mean discomfort of all parameters.
+The table is built with one pivot of the comfort statistics, rooms are ranked from the worst score.
+"""
+import pandas as pd
+from settings import *
+from comfort_stats import PARAMETERS, PERIODS
+
+PAGE_SIZE = 20
+# Categories outside the comfort categories I-II
+DISCOMFORT = {
+    'Temperature': ['Cat -IV', 'Cat -III', 'Cat +III', 'Cat +IV'],
+    'RH': ['Cat -IV', 'Cat -III', 'Cat +III', 'Cat +IV'],
+    'CO2': ['Cat III', 'Cat IV'],
+    'VOC': ['Cat III', 'Cat IV'],
+}
+
+
+def portfolio_table(stats, period):
+    """Discomfort (%) of every parameter, score and rank of each room in a monitoring period."""
+    mask = (stats['Monitoring_Period'] == period) & (stats['Season'] == 'All')
+    table = stats[mask].pivot_table(index='Room', columns=['Parameter', 'Statistic'], values='Value')
+    columns = {parameter: table[parameter].reindex(columns=labels).sum(axis=1, min_count=1)
+               for parameter, labels in DISCOMFORT.items()}
+    df = pd.DataFrame({f'{parameter} discomfort [%]': values for parameter, values in columns.items()})
+    df['Missing data [%]'] = pd.concat([table[parameter]['Missing data'] for parameter in PARAMETERS],
+                                       axis=1).mean(axis=1)
+    df['Score'] = df.iloc[:, :len(DISCOMFORT)].mean(axis=1)
+    df = df.reindex([room for room in room_lst if room in df.index])
+    df.insert(0, 'Building', [room_buildings[room] for room in df.index])
+    df.insert(0, 'Name', [room_names[room_lst.index(room)] for room in df.index])
+    df['Rank'] = df['Score'].rank(ascending=False, method='min').astype('Int64')
+    return df.round(1)
+
+
+def portfolio_tables(stats):
+    """Portfolio table of each monitoring period."""
+    return {period: portfolio_table(stats, period) for period in PERIODS}
+
+
+def rank_rooms(table, worst_first=False, buildings=None):
+    """Rooms of the portfolio in config order or from the worst score, optionally of some buildings."""
+    if buildings:
+        table = table[table['Building'].isin(buildings)]
+    if worst_first:
+        table = table.sort_values(['Rank', 'Name'])
+    return list(table.index)
+
+
+def n_pages(n_rooms, page_size=PAGE_SIZE):
+    return max(1, -(-n_rooms // page_size))
+
+
+def page_rooms(rooms, page, page_size=PAGE_SIZE):
+    """Rooms of one page, pages start at 1."""
+    return rooms[(page - 1) * page_size: page * page_size]
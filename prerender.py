@@ -0,0 +1,231 @@
+"""Batch rendering of all statplots figures to ./Results/Figures.
+
+Figures are rendered in a process pool, every worker uses the Agg backend. The figures of a room are
+rendered by as few workers as keep the pool busy, so its data is prepared once per worker. A manifest
+keeps the hashes of the input datasets, of the plotting code and of each output file, a figure is
+rendered again only when one of its inputs has changed. The manifest is updated as figures complete.
+
+Render all rooms on all cores:
+    python prerender.py
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+
+import datacache
+from settings import *
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+OUTPUT_DIR = os.path.join(APP_DIR, 'Results', 'Figures')
+MANIFEST = 'manifest.json'
+CODE_FILES = [os.path.join(APP_DIR, name) for name in
+              ['statplots.py', 'comfort_stats.py', 'rollups.py', 'density.py', 'decimate.py', 'correlation.py',
+               'episodes.py', 'degreedays.py', 'settings.py']]
+
+# Figures of each room: (name, statplots function, input data, arguments after room name)
+ROOM_FIGURES = [
+    ('boxplot_monthly_temp', 'boxplot_monthly_temp', 'box', ()),
+    ('boxplot_monthly_rh', 'boxplot_monthly_rh', 'box', ()),
+    ('boxplot_monthly_co2', 'boxplot_monthly_co2', 'box', ()),
+    ('boxplot_monthly_voc', 'boxplot_monthly_voc', 'box', ()),
+    ('density_temp', 'plot_density_temp', 'density', ()),
+    ('density_temp_season', 'plot_density_temp', 'density', (True,)),
+    ('temperature_series', 'plot_temp', 'series', ()),
+    ('comfort_cat_temp', 'plot_comfort_cat_temp_rh', 'stats', ('Temperature',)),
+    ('comfort_cat_rh', 'plot_comfort_cat_temp_rh', 'stats', ('RH',)),
+    ('comfort_cat_co2', 'plot_comfort_cat_co2_voc', 'stats', ('CO2',)),
+    ('comfort_cat_voc', 'plot_comfort_cat_co2_voc', 'stats', ('VOC',)),
+    ('monthly_window', 'plot_monthly_window', 'window', ()),
+    ('window_temp_out', 'plot_window_temp_out', 'daily', ()),
+    ('corr_matrix_BASELINE', 'plot_corr_matrix', 'corr', ('BASELINE',)),
+    ('corr_matrix_MOBISTYLE', 'plot_corr_matrix', 'corr', ('MOBISTYLE',)),
+]
+
+# Figures of all rooms or of the outdoor data: (name, statplots function, input data, arguments)
+SHARED_FIGURES = [
+    ('comfort_cat_summary_temp', 'plot_comfort_cat_summary_temp', 'summary', ()),
+    ('outdoor_temp', 'plot_t_out', 'outdoor', ('Outdoor Temperature',)),
+    ('outdoor_rh', 'plot_t_out', 'outdoor', ('Outdoor RH',)),
+    ('outdoor_global_radiation', 'plot_t_out', 'outdoor', ('Global radiation',)),
+    ('outdoor_diffuse_radiation', 'plot_t_out', 'outdoor', ('Diffuse radiation',)),
+    ('degree_days', 'plot_hdd', 'degree_days', ()),
+]
+
+
+def figure_jobs(rooms=None):
+    """List of (output file, statplots function, input data, room, arguments).
+    The summary of all rooms is only rendered without a list of rooms.
+    """
+    shared = [figure for figure in SHARED_FIGURES if rooms is None or figure[2] != 'summary']
+    rooms = room_lst if rooms is None else rooms
+    jobs = [(f'{name}.png', func, data, None, args) for name, func, data, args in shared]
+    jobs += [(f'{name}_{room}.png', func, data, room, args)
+             for room in rooms for name, func, data, args in ROOM_FIGURES]
+    return jobs
+
+
+def job_datasets(job):
+    """Cached datasets a figure is drawn from."""
+    _, _, data, room, _ = job
+    if data in ('outdoor', 'degree_days'):
+        return ['outdoor_data']
+    if data == 'summary':
+        return [f'Data_{room}' for room in room_lst]
+    return [f'Data_{room}', 'outdoor_data']
+
+
+def job_inputs(job, versions, code_hash):
+    """Hashes of everything a figure depends on."""
+    _, func, _, room, args = job
+    return {'function': func, 'room': room, 'args': list(args), 'code': code_hash,
+            'data': {name: versions.get(name) for name in job_datasets(job)}}
+
+
+def job_tasks(jobs, workers):
+    """Jobs split in pool tasks. The figures of a room are split in as few tasks as keep `workers`
+    busy, a task prepares the room data once for all its figures.
+    """
+    by_room = {}
+    for job in jobs:
+        by_room.setdefault(job[3], []).append(job)
+    tasks = [[job] for job in by_room.pop(None, [])]
+    chunks = max(1, workers // max(len(by_room), 1))
+    for room_jobs in by_room.values():
+        tasks += [room_jobs[i::chunks] for i in range(min(chunks, len(room_jobs)))]
+    return tasks
+
+
+def code_hash():
+    sha = hashlib.sha1()
+    for path in CODE_FILES:
+        sha.update(datacache.file_hash(path).encode())
+    return sha.hexdigest()
+
+
+# WORKER
+def init_worker():
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+@lru_cache(maxsize=1)
+def outdoor():
+    return datacache.load_outdoor()
+
+
+@lru_cache(maxsize=2)
+def room_inputs(room):
+    from comfort_stats import room_stats
+    from rollups import room_series, daily_data, room_box_stats
+    from episodes import episode_index, window_counts
+    from density import density_grids
+    from correlation import spearman_matrices
+    from decimate import decimate, n_buckets
+    data = datacache.load_room(room)
+    daily = daily_data(data, outdoor())
+    return {'daily': daily, 'corr': spearman_matrices(daily),
+            'series': decimate(room_series(data, outdoor()), n_buckets(11.7)),
+            'stats': room_stats(data, room), 'box': room_box_stats(data, room),
+            'density': density_grids(data, outdoor()), 'window': window_counts(episode_index(data))}
+
+
+def job_args(job):
+    """Arguments of the statplots function of a job."""
+    from comfort_stats import comfort_stats
+    from rollups import outdoor_box_stats
+    from degreedays import daily_mean, degree_days
+
+    _, _, data, room, args = job
+    if data == 'outdoor':
+        return (outdoor_box_stats(outdoor()),) + args
+    if data == 'degree_days':
+        return (degree_days(daily_mean(outdoor())),) + args
+    if data == 'summary':
+        return (comfort_stats({room: datacache.load_room(room) for room in room_lst}),) + args
+    return (room_inputs(room)[data], room_names[room_lst.index(room)]) + args
+
+
+def render_job(job, output_dir):
+    import statplots
+    from figcache import render_figure
+
+    start = time.perf_counter()
+    filename, func = job[:2]
+    image = render_figure(getattr(statplots, func)(*job_args(job)))
+    with open(os.path.join(output_dir, filename), 'wb') as f:
+        f.write(image)
+    return filename, hashlib.sha1(image).hexdigest(), time.perf_counter() - start
+
+
+def render_task(jobs, output_dir):
+    return [render_job(job, output_dir) for job in jobs]
+
+
+# MANIFEST
+def read_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_manifest(output_dir, manifest):
+    path = os.path.join(output_dir, MANIFEST)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def prerender(rooms=None, output_dir=OUTPUT_DIR, workers=None, force=False):
+    """Render all out of date figures, returns the list of rendered files."""
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = figure_jobs(rooms)
+    for name in sorted({name for job in jobs for name in job_datasets(job)}):
+        if not datacache.is_fresh(name, datacache.read_manifest()):
+            datacache.convert(name)
+    versions = {name: datacache.version(name) for name in datacache.read_manifest()}
+    code = code_hash()
+    manifest = read_manifest(output_dir)
+
+    todo = {}
+    for job in jobs:
+        inputs = job_inputs(job, versions, code)
+        entry = manifest.get(job[0])
+        if force or entry is None or entry['inputs'] != inputs or not os.path.exists(
+                os.path.join(output_dir, job[0])):
+            todo[job[0]] = (job, inputs)
+
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        futures = [pool.submit(render_task, task, output_dir)
+                   for task in job_tasks([job for job, _ in todo.values()], workers)]
+        for future in as_completed(futures):
+            for filename, sha1, seconds in future.result():
+                manifest[filename] = {'inputs': todo[filename][1], 'sha1': sha1}
+                print(f'{filename:<45} {seconds:6.2f} s')
+            write_manifest(output_dir, manifest)
+    return list(todo)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render all statplots figures to ./Results/Figures.')
+    parser.add_argument('--rooms', nargs='*', default=None,
+                        help='room IDs, the summary of all rooms is skipped (default: all rooms)')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: CPU count)')
+    parser.add_argument('--output', default=OUTPUT_DIR, help='output directory')
+    parser.add_argument('--force', action='store_true', help='render even if the inputs are unchanged')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    rendered = prerender(args.rooms, args.output, args.workers, args.force)
+    print(f'{len(rendered)} figures rendered in {time.perf_counter() - start:.1f} s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,337 @@
+"""Lazy registry of the app datasets.
+
+Every room and metadata table is loaded on first access and memoized on its own. The registry
+lives for the whole server process, so Streamlit reruns and other sessions reuse loaded data.
+The least recently used datasets are evicted when the total size exceeds the memory cap
+(MOBISTYLE_CACHE_MB, default 512 MB).
+Room data is read from the Feather cache, or from the SQL database with MOBISTYLE_STORAGE=sql; the
+comfort counts, daily means and box-plot statistics of the rooms are then computed from queries that
+aggregate in the database.
+"""
+import hashlib
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+from functools import partial
+
+import numpy as np
+import pandas as pd
+import datacache
+import partitions
+import instrument
+from settings import *
+from comfort_stats import INPUT_COLUMNS, room_counts, comfort_stats_from_counts, range_stats
+from rollups import ROOM_PARAMETERS, room_series, daily_sums, daily_from_sums, all_box_stats
+from episodes import episode_index, window_counts
+from degreedays import daily_mean, degree_days as monthly_degree_days
+from categorize import comfort_arrays, limit_key, recategorized_stats
+from density import density_grids
+from decimate import decimate
+from portfolio import portfolio_tables
+from correlation import spearman_matrices
+
+MAX_MB = float(os.environ.get('MOBISTYLE_CACHE_MB', 512))
+STORAGE = os.environ.get('MOBISTYLE_STORAGE', 'files')
+
+
+def object_size(obj):
+    """Memory size of a loaded dataset in bytes."""
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True).sum())
+    if isinstance(obj, pd.Series):
+        return int(obj.memory_usage(deep=True))
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, (tuple, list)):
+        return sum(object_size(item) for item in obj)
+    if isinstance(obj, dict):
+        return sum(object_size(item) for item in obj.values())
+    return sys.getsizeof(obj)
+
+
+class DatasetRegistry:
+    """The registry lock guards the bookkeeping dicts only. Loaders and updates run under a lock of
+    their dataset, so other datasets are served and loaded meanwhile and a dataset is loaded once.
+    """
+
+    def __init__(self, max_mb=MAX_MB):
+        self.max_bytes = max_mb * 2 ** 20
+        self._loaders = {}
+        self._items = OrderedDict()
+        self._info = {}
+        self._lock = threading.RLock()
+        # Dataset name -> lock held while the dataset is loaded or updated
+        self._loading = {}
+        # Ad-hoc datasets, unregistered when they leave the cache
+        self._transient = set()
+        self._sync_lock = threading.Lock()
+        self.version = None
+        # Fingerprint of the source files and ingested batch paths of the loaded datasets, None before the first sync
+        self.sources = None
+        self.batches = None
+
+    def register(self, name, loader):
+        """Register a loader function called without arguments on first access of `name`."""
+        with self._lock:
+            self._loaders[name] = loader
+            self._loading.setdefault(name, threading.RLock())
+            self.evict(name)
+
+    def __contains__(self, name):
+        return name in self._loaders
+
+    def _cached(self, name):
+        """Loaded dataset `name` or None, counted as a hit. Call with the registry lock held."""
+        if name in self._items:
+            self._items.move_to_end(name)
+            self._info[name]['hits'] += 1
+            return self._items[name]
+
+    def get(self, name, retain=True):
+        """Return the dataset `name`, loading it if needed.
+        With retain=False a dataset that is not loaded yet is returned without being stored.
+        """
+        with self._lock:
+            obj = self._cached(name)
+            if obj is not None:
+                return obj
+            loading, loader = self._loading[name], self._loaders[name]
+        return self._load(name, loading, loader, retain)
+
+    def get_transient(self, name, loader):
+        """Return the ad-hoc dataset `name` (a date range, a limit set...), registered with `loader` if needed.
+        The registration is dropped when the dataset is evicted, so ad-hoc names do not pile up.
+        """
+        with self._lock:
+            obj = self._cached(name)
+            if obj is not None:
+                return obj
+            if name not in self._loaders:
+                self._loaders[name] = loader
+                self._loading[name] = threading.RLock()
+                self._transient.add(name)
+            loading, loader = self._loading[name], self._loaders[name]
+        return self._load(name, loading, loader, True)
+
+    def _load(self, name, loading, loader, retain):
+        with loading:
+            # Another thread may have loaded the dataset while this one waited
+            with self._lock:
+                obj = self._cached(name)
+                if obj is not None:
+                    return obj
+
+            start = time.perf_counter()
+            with instrument.stage(f'load {name}') as record:
+                obj = loader()
+                record.rows = instrument.n_rows(obj)
+            size = object_size(obj)
+
+            with self._lock:
+                info = self._info.setdefault(name, {'loads': 0, 'hits': 0})
+                info.update(load_time=time.perf_counter() - start, size=size)
+                info['loads'] += 1
+                if retain:
+                    self._items[name] = obj
+                    self._shrink()
+            return obj
+
+    def update(self, name, func):
+        """Replace a loaded dataset by func(dataset), datasets that are not loaded are left alone."""
+        with self._loading[name]:
+            with self._lock:
+                if name not in self._items:
+                    return
+                obj = self._items[name]
+            obj = func(obj)
+            size = object_size(obj)
+            with self._lock:
+                self._items[name] = obj
+                self._info[name]['size'] = size
+                self._shrink()
+
+    def sync(self):
+        """Bring the loaded datasets up to date with the data files and return the data version.
+        Batches ingested since the last call, also by another process, are applied to the loaded datasets
+        with `ingest.apply_batch`; any other change of the data files drops all loaded datasets.
+        """
+        state = data_state()
+        version = datacache.data_version(state)
+        if version == self.version:
+            return version
+        with self._sync_lock:
+            if version != self.version:
+                sources, batches = state
+                if self.version is not None and sources == self.sources and self.batches.issubset(batches):
+                    from ingest import apply_batch
+                    for path in batches:
+                        if path not in self.batches:
+                            self.batches.add(path)
+                            apply_batch(os.path.basename(os.path.dirname(path))[len('Data_'):],
+                                        datacache.load_batch(path))
+                else:
+                    self.clear()
+                    self.sources, self.batches = sources, set(batches)
+                self.version = version
+        return version
+
+    def _remove(self, name):
+        """Drop a loaded dataset, and the registration of a transient one. Call with the registry lock held."""
+        self._items.pop(name, None)
+        if name in self._transient:
+            self._transient.discard(name)
+            for entries in (self._loaders, self._loading, self._info):
+                entries.pop(name, None)
+
+    def evict(self, name):
+        with self._lock:
+            self._remove(name)
+
+    def evict_prefix(self, prefix):
+        with self._lock:
+            for name in [name for name in self._items if name.startswith(prefix)]:
+                self._remove(name)
+
+    def clear(self):
+        with self._lock:
+            for name in list(self._items):
+                self._remove(name)
+
+    def nbytes(self):
+        return sum(self._info[name]['size'] for name in self._items)
+
+    def _shrink(self):
+        while len(self._items) > 1 and self.nbytes() > self.max_bytes:
+            self._remove(next(iter(self._items)))
+
+    def report(self):
+        """Per-dataset size (MB), last load time (s), load and hit counts."""
+        with self._lock:
+            rows = [{'Dataset': name, 'Loaded': name in self._items, 'Size [MB]': info['size'] / 2 ** 20,
+                     'Load time [s]': info['load_time'], 'Loads': info['loads'], 'Hits': info['hits']}
+                    for name, info in self._info.items()]
+        return pd.DataFrame(rows, columns=['Dataset', 'Loaded', 'Size [MB]', 'Load time [s]', 'Loads', 'Hits']
+                            ).set_index('Dataset').round(3)
+
+    def memory_report(self):
+        """Rows, size (MB) and float64 size (MB) of the numeric columns of each loaded room, whether its index is
+        shared and whether its columns are read-only views of the memory-mapped cache file.
+        """
+        with self._lock:
+            frames = {name[len('Data_'):]: df for name, df in self._items.items() if name.startswith('Data_')}
+        rows = [{'Room': room, 'Rows': len(df),
+                 'Size [MB]': df.memory_usage(deep=True, index=False).sum() / 2 ** 20,
+                 'Index [MB]': df.index.nbytes / 2 ** 20,
+                 'As float64 [MB]': len(df) * 8 * sum(map(pd.api.types.is_numeric_dtype, df.dtypes)) / 2 ** 20,
+                 'Shared index': df.index is datacache.shared_index(df.index),
+                 'Mapped': not df['Temperature'].to_numpy().flags.writeable}
+                for room, df in frames.items()]
+        return pd.DataFrame(rows, columns=['Room', 'Rows', 'Size [MB]', 'Index [MB]', 'As float64 [MB]', 'Shared index',
+                                           'Mapped']).set_index('Room').round(3)
+
+    def rooms(self, retain=True):
+        """Read-only mapping room -> room data, loaded on item access."""
+        return RoomMapping(self, retain)
+
+
+class RoomMapping(Mapping):
+    def __init__(self, registry, retain):
+        self.registry, self.retain = registry, retain
+
+    def __getitem__(self, room):
+        if room not in room_lst:
+            raise KeyError(room)
+        return self.registry.get(f'Data_{room}', retain=self.retain)
+
+    def __iter__(self):
+        return iter(room_lst)
+
+    def __len__(self):
+        return len(room_lst)
+
+
+def room_and_outdoor(room):
+    return registry.get(f'Data_{room}', retain=False), registry.get('outdoor_data')
+
+
+if STORAGE == 'sql':
+    from sqlstore import SQLStore
+    store = SQLStore()
+    load_room = store.load_room
+
+    def data_state():
+        """Fingerprint of the cache files and the database, ingested batches are not read in SQL mode."""
+        sources, _ = datacache.data_state()
+        return hashlib.sha1((sources + store.data_version()).encode()).hexdigest(), []
+else:
+    data_state = datacache.data_state
+
+    def load_room(room):
+        """Room data with the ingested batches applied to the registry, all batches before the first sync."""
+        return datacache.load_room(room, registry.batches)
+
+
+def time_series(room, buckets):
+    """Decimated office and outdoor temperature of a room, cached per room and number of buckets."""
+    return registry.get_transient(f'series_{room}_{buckets}',
+                                  lambda: decimate(room_series(*room_and_outdoor(room)), buckets))
+
+
+def period_stats(room, start, end):
+    """Comfort statistics of a room from `start` to `end` (excluded), read from the monthly partitions
+    and cached per date range.
+    """
+    return registry.get_transient(f'period_stats_{room}_{start:%Y%m%d}_{end:%Y%m%d}',
+                                  lambda: range_stats({room: partitions.read_room(room, start, end, INPUT_COLUMNS)}))
+
+
+def degree_days(heating, cooling):
+    """Monthly heating and cooling degree-days, cached per pair of base temperatures."""
+    return registry.get_transient(f'degree_days_{heating:g}_{cooling:g}',
+                                  lambda: monthly_degree_days(registry.get('outdoor_daily'), heating, cooling))
+
+
+def what_if_stats(limits):
+    """Comfort statistics of all rooms with other category limits, cached per limit set."""
+    return registry.get_transient(f'what_if_{limit_key(limits)}', lambda: recategorized_stats(
+        registry.get('comfort_stats'), {room: registry.get(f'comfort_arrays_{room}') for room in room_lst}, limits))
+
+
+registry = DatasetRegistry()
+registry.register('outdoor_data', datacache.load_outdoor)
+registry.register('room_info', datacache.load_room_info)
+registry.register('HDDs_SL', datacache.load_hdd)
+registry.register('comfort_categories', datacache.load_categories)
+registry.register('outdoor_daily', lambda: daily_mean(registry.get('outdoor_data')))
+
+# Rooms and their aggregates, an aggregate reads its room without keeping it in memory
+for room in room_lst:
+    registry.register(f'Data_{room}', partial(load_room, room))
+    registry.register(f'comfort_counts_{room}', lambda room=room: room_counts(registry.get(f'Data_{room}', False)))
+    registry.register(f'comfort_arrays_{room}', lambda room=room: comfort_arrays(registry.get(f'Data_{room}', False)))
+    registry.register(f'daily_sums_{room}', lambda room=room: daily_sums(*room_and_outdoor(room)))
+    registry.register(f'daily_{room}', lambda room=room: daily_from_sums(registry.get(f'daily_sums_{room}')))
+    registry.register(f'corr_{room}', lambda room=room: spearman_matrices(registry.get(f'daily_{room}')))
+    registry.register(f'episodes_{room}', lambda room=room: episode_index(registry.get(f'Data_{room}', False)))
+    registry.register(f'window_{room}', lambda room=room: window_counts(registry.get(f'episodes_{room}')))
+    registry.register(f'density_{room}', lambda room=room: density_grids(registry.get(f'Data_{room}', False),
+                                                                         registry.get('outdoor_data')))
+
+# Aggregates of all rooms
+registry.register('comfort_stats', lambda: comfort_stats_from_counts(
+    {room: registry.get(f'comfort_counts_{room}') for room in room_lst}))
+registry.register('correlations', lambda: {room: registry.get(f'corr_{room}') for room in room_lst})
+registry.register('portfolio', lambda: portfolio_tables(registry.get('comfort_stats')))
+registry.register('box_stats', lambda: all_box_stats(registry.rooms(retain=False), registry.get('outdoor_data')))
+
+# SQL mode: the database counts, averages and filters the rooms
+if STORAGE == 'sql':
+    for room in room_lst:
+        registry.register(f'comfort_counts_{room}', partial(store.room_counts, room))
+        registry.register(f'daily_{room}', lambda room=room: store.daily_data(room, registry.get('outdoor_data')))
+    registry.register('box_stats', lambda: all_box_stats(
+        {room: store.load_room(room, columns=ROOM_PARAMETERS, occupied=True) for room in room_lst},
+        registry.get('outdoor_data'), occupied=False))
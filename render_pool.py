@@ -0,0 +1,120 @@
+"""Concurrent rendering of the figures of one page run.
+
+statplots draws with pyplot, whose global state is not thread safe, so figures are rendered in a
+pool of worker processes with the Agg backend. The pool is started once per app process and shared
+by all sessions. A page shows its figures in page order: cached figures are shown at once, the
+others get a placeholder that is filled when its worker returns the image.
+
+The number of workers is set with MOBISTYLE_RENDER_WORKERS (default: CPU count). With one worker,
+or when the pool cannot be started or breaks, figures are rendered serially in the script thread.
+"""
+import importlib
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import instrument
+from figcache import figure_cache, render_figure
+
+WORKERS = int(os.environ.get('MOBISTYLE_RENDER_WORKERS', os.cpu_count() or 1))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+# WORKER
+def init_worker():
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def render_job(module, name, args, kwargs, fmt):
+    func = getattr(importlib.import_module(module), name)
+    return render_figure(func(*args, **kwargs), fmt)
+
+
+# POOL
+def start_method():
+    """forkserver where available, forking the threaded app server could copy locks held by other threads."""
+    return 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+def get_pool(workers=WORKERS):
+    """Shared process pool, None for serial rendering."""
+    global _pool
+    if workers <= 1:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            try:
+                context = multiprocessing.get_context(start_method())
+                _pool = ProcessPoolExecutor(workers, mp_context=context, initializer=init_worker)
+            except (OSError, ValueError, NotImplementedError):
+                return None
+        return _pool
+
+
+def reset_pool():
+    """Drop a broken pool, the next page run starts a new one."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = None
+
+
+class PageRenderer:
+    """Figures of one page run, rendered concurrently and shown in page order."""
+    def __init__(self, version, pool=None, cache=figure_cache, fmt='png'):
+        self.version = version
+        self.pool = pool
+        self.cache = cache
+        self.fmt = fmt
+        # figure key: (future, plot function, args, kwargs, placeholders)
+        self.pending = {}
+
+    def show(self, placeholder, func, *args, **kwargs):
+        """Show func(*args, **kwargs) in the placeholder, from the cache or once it is rendered."""
+        key, data = self.cache.lookup(func, args, kwargs, self.version, self.fmt)
+        if key in self.pending:
+            self.pending[key][-1].append(placeholder)
+            return
+        if data is None and self.pool is not None:
+            try:
+                future = self.pool.submit(render_job, func.__module__, func.__name__, args, kwargs, self.fmt)
+                self.pending[key] = (future, func, args, kwargs, [placeholder])
+                return
+            except (BrokenProcessPool, RuntimeError):
+                self.pool = None
+                reset_pool()
+        if data is None:
+            data = self.render(key, func, args, kwargs)
+        placeholder.image(data, use_column_width=True)
+
+    def render(self, key, func, args, kwargs):
+        """Serial rendering in the script thread."""
+        with instrument.stage(f'plot {func.__name__}'):
+            fig = func(*args, **kwargs)
+        with instrument.stage(f'savefig {func.__name__}'):
+            data = render_figure(fig, self.fmt)
+        self.cache.put(key, data, self.fmt)
+        return data
+
+    def wait(self):
+        """Fill the placeholders of the submitted figures as they complete."""
+        with instrument.stage('render figures') as record:
+            record.rows = len(self.pending)
+            keys = {item[0]: key for key, item in self.pending.items()}
+            for future in as_completed(keys):
+                key = keys[future]
+                _, func, args, kwargs, placeholders = self.pending.pop(key)
+                try:
+                    data = future.result()
+                    self.cache.put(key, data, self.fmt)
+                except BrokenProcessPool:
+                    reset_pool()
+                    data = self.render(key, func, args, kwargs)
+                for placeholder in placeholders:
+                    placeholder.image(data, use_column_width=True)
@@ -0,0 +1,138 @@
+"""Daily and monthly rollups of the room data.
+
+Five-number summaries (lower whisker, Q1, median, Q3, upper whisker) of each room, parameter,
+month and monitoring period are computed once, so box plots are drawn from a small table
+instead of the raw 15-minute samples. Whiskers follow the box plots drawn so far: the most
+extreme values within 1.5 IQR of the box.
+
+Daily means are kept as sums and counts, so rollups of new data are merged with `add_sums`.
+"""
+import numpy as np
+import pandas as pd
+from settings import *
+from datacache import select_columns
+
+ROOM_PARAMETERS = ['Temperature', 'RH', 'CO2', 'VOC']
+OUTDOOR_PARAMETERS = ['Outdoor Temperature', 'Outdoor RH', 'Global radiation', 'Diffuse radiation']
+OUTDOOR = 'Outdoor'
+TIME_SERIES = ['Temperature', 'Outdoor Temperature']
+STATS = ['count', 'whislo', 'q1', 'med', 'q3', 'whishi']
+COLUMNS = ['Room', 'Parameter', 'Monitoring_Period', 'Month'] + STATS
+
+
+def outdoor_columns(outdoor_data, index):
+    """Outdoor values (without Monitoring_Period) on the timestamps of room data."""
+    outdoor = outdoor_data.iloc[:, :-1]
+    return outdoor if outdoor.index.equals(index) else outdoor.reindex(index)
+
+
+def room_data(data, outdoor_data):
+    """Join room data with outdoor data on Timestamp."""
+    return pd.concat([data, outdoor_columns(outdoor_data, data.index)], axis=1)
+
+
+def daily_sums(df, outdoor_data=None):
+    """Daily sums and counts of the numeric columns by Monitoring period and Season.
+    The outdoor columns of `outdoor_data` are summed on the room timestamps without a joined copy
+    of the room data.
+    """
+    numeric = [column for column, dtype in df.dtypes.items() if pd.api.types.is_numeric_dtype(dtype)]
+    frames = [select_columns(df, numeric)]
+    if outdoor_data is not None:
+        frames.append(outdoor_columns(outdoor_data, df.index))
+    keys = [df['Monitoring_Period'].astype(object).to_numpy(), df['Season'].astype(object).to_numpy(),
+            df.index.floor('D')]
+    grouped = [frame.groupby(keys) for frame in frames]
+    return pd.concat({'sum': pd.concat([group.sum() for group in grouped], axis=1),
+                      'count': pd.concat([group.count() for group in grouped], axis=1)},
+                     axis=1).rename_axis(['Monitoring_Period', 'Season', 'Timestamp'])
+
+
+def room_series(data, outdoor_data, columns=TIME_SERIES):
+    """Room and outdoor columns on the room timestamps."""
+    outdoor = outdoor_columns(outdoor_data, data.index)
+    return pd.DataFrame({column: data[column] if column in data else outdoor[column] for column in columns})
+
+
+def daily_from_sums(sums):
+    """Daily means by Monitoring period and Season from daily sums."""
+    return ((sums['sum'] / sums['count'].where(sums['count'] > 0))
+            .dropna(how='all').reset_index().set_index('Timestamp'))
+
+
+def daily_data(df, outdoor_data=None):
+    """Daily means by Monitoring period and Season."""
+    return daily_from_sums(daily_sums(df, outdoor_data))
+
+
+def add_sums(sums, other):
+    """Merge the sums and counts of two disjoint sets of rows."""
+    return sums.add(other, fill_value=0).sort_index()
+
+
+def monitoring_period(index):
+    """Monitoring period of each timestamp, the same split as the box plots."""
+    period = pd.Series(np.nan, index=index, dtype=object)
+    period.loc[BL_start: BL_end] = 'BASELINE'
+    period.loc[MS_start: MS_end] = 'MOBISTYLE'
+    return period.to_numpy()
+
+
+def box_stats(df, parameters, room):
+    """Box-plot statistics of `parameters` by monitoring period and month."""
+    keys = {'Monitoring_Period': monitoring_period(df.index), 'Month': df.index.month}
+    tables = []
+    for parameter in parameters:
+        data = pd.DataFrame(dict(keys, value=df[parameter].to_numpy(dtype=float))).dropna()
+        if data.empty:
+            continue
+        grouped = data.groupby(['Monitoring_Period', 'Month'])['value']
+        quartiles = grouped.quantile([.25, .5, .75]).unstack()
+        quartiles.columns = ['q1', 'med', 'q3']
+
+        # Whiskers: most extreme values within 1.5 IQR of the box
+        limits = quartiles.reindex(pd.MultiIndex.from_frame(data[['Monitoring_Period', 'Month']]))
+        iqr = (limits['q3'] - limits['q1']).to_numpy()
+        value = data['value'].to_numpy()
+        data['low'] = np.where(value >= limits['q1'].to_numpy() - 1.5 * iqr, value, np.nan)
+        data['high'] = np.where(value <= limits['q3'].to_numpy() + 1.5 * iqr, value, np.nan)
+        whiskers = data.groupby(['Monitoring_Period', 'Month']).agg(
+            count=('value', 'size'), whislo=('low', 'min'), whishi=('high', 'max'))
+
+        table = whiskers.join(quartiles).reset_index()
+        table.insert(0, 'Parameter', parameter)
+        tables.append(table)
+
+    if not tables:
+        return pd.DataFrame(columns=COLUMNS)
+    table = pd.concat(tables, ignore_index=True)
+    table.insert(0, 'Room', room)
+    return table[COLUMNS]
+
+
+def room_box_stats(df, room, occupied=True):
+    if occupied:
+        df = select_columns(df, ROOM_PARAMETERS, df['Room Status'].to_numpy() > 0)
+    return box_stats(df, ROOM_PARAMETERS, room)
+
+
+def outdoor_box_stats(outdoor_data):
+    return box_stats(outdoor_data, OUTDOOR_PARAMETERS, OUTDOOR)
+
+
+def update_box_stats(stats, df, room, occupied=True):
+    """Replace the box-plot statistics of the (period, month) groups present in `df`.
+    `df` must hold all rows of these groups, not only the new ones.
+    """
+    new = room_box_stats(df, room, occupied) if room != OUTDOOR else outdoor_box_stats(df)
+    keys = ['Room', 'Monitoring_Period', 'Month']
+    replaced = stats.set_index(keys).index.isin(new.set_index(keys).index)
+    return pd.concat([stats[~replaced], new], ignore_index=True)
+
+
+def all_box_stats(data_dct, outdoor_data, occupied=True):
+    """Box-plot statistics of all rooms (occupied hours) and of the outdoor data.
+    With occupied=False the room data is expected to hold the occupied rows only.
+    """
+    tables = [room_box_stats(df, room, occupied) for room, df in data_dct.items()]
+    return pd.concat(tables + [outdoor_box_stats(outdoor_data)], ignore_index=True)
@@ -1,27 +1,33 @@
 import streamlit as st
 import numpy as np
+import pandas as pd
 from statplots import *
+from registry import registry, time_series, period_stats, degree_days, what_if_stats
+from portfolio import PAGE_SIZE, rank_rooms, n_pages, page_rooms
+from correlation import cross_room
+from episodes import episode_summary
+from degreedays import HEATING_BASE, COOLING_BASE, normalized_comparison
+from decimate import n_buckets
+from comfort_stats import CUSTOM, PARAMETERS, category_table, summary_table
+from categorize import ALL, LIMITS, COOLING_TEMP, limit_set
+from figcache import figure_cache
+from render_pool import PageRenderer, get_pool
+import instrument
+import vega
+import warmup
 
 
 def app():
+    instrument.start_run('Room Selection')
     st.title('Room Selection')
     summary = st.beta_container()
 
-    # LOAD DATA
-    room_info = pd.read_excel('./Data/room_info.xlsx', index_col='Room_ID', parse_dates=True).loc[room_lst, ]
-    room_info = room_info.rename(index=dict(zip(room_lst, room_names))).replace({np.nan: None})
-
-    hdd = pd.read_excel('./Data/HDDs_SL.xlsx', index_col='Timestamp', parse_dates=True,
-                        usecols=[0, 1, 2], nrows=25)
-    outdoor_data = pd.read_csv('./Data/outdoor_data.csv', parse_dates=True, index_col='Timestamp')
-    outdoor_data = outdoor_data.rename(columns={'RH': 'Outdoor RH', 'Temperature': 'Outdoor Temperature'})
-    outdoor_data.loc[BL_start: BL_end, 'Monitoring_Period'] = 'BASELINE'
-    outdoor_data.loc[MS_start: MS_end, 'Monitoring_Period'] = 'MOBISTYLE'
-    categories = pd.read_excel('./Data/comfort_categories.xlsx', index_col='Category')
+    version = registry.sync()
+    renderer = PageRenderer(version, get_pool())
 
     def category_limits(key):
         if st.checkbox('Comfort category limits', key=key):
-            st.table(categories)
+            st.table(registry.get('comfort_categories'))
             st.write("""
             * CO2 concentration includes 400 ppm of an outdoor air concentration while estimating the category limits
             * DS/EN 15251 with sedentary activity level 1,2 [met]
@@ -31,47 +37,56 @@ def app():
 
     category_limits(1)
 
-    # suppress_st_warning=True
-    @st.cache(show_spinner=False)
-    def get_data():
-        dtypes = {
-            'LED': 'category',
-            'App': 'category',
-            'Monitoring_Period': 'category',
-            'HEAT_COOL': 'category',
-            'Category_TEMP': 'category',
-            'Category_RH': 'category',
-            'Category_CO2': 'category',
-            'Category_VOC': 'category'
-        }
-        data_dct = {room:  pd.read_csv(
-            f'./Data/Data_{room}.csv',
-            usecols=list(
-                [f'{room}_OCC', f'{room}_WINDOW', f'{room}_WINDOW_Openings', f'{room}_INAP_co2',
-                 f'{room}_INAP_humidity', f'{room}_INAP_voc', f'{room}_TEMP', 'Monitoring_Period', 'HEAT_COOL',
-                 'Category_TEMP', 'Category_RH', 'Category_CO2', 'Category_VOC', 'Timestamp'
-                 ]),
-            dtype=dtypes,
-            parse_dates=True,
-            index_col='Timestamp').rename(
-            columns={'HEAT_COOL': 'Season',
-                     f'{room}_OCC': 'Room Status',
-                     f'{room}_WINDOW': 'Window State',
-                     f'{room}_WINDOW_Openings': 'Window State Change',
-                     f'{room}_INAP_co2': 'CO2',
-                     f'{room}_INAP_humidity': 'RH',
-                     f'{room}_INAP_voc': 'VOC',
-                     f'{room}_TEMP': 'Temperature',
-                     }) for room in room_lst}
-        return data_dct
+    def section(title, expanded=False, header=st.header):
+        """Header of a page section and whether its content is shown.
+        Datasets of a section are loaded (and memoized per room in the registry) only when it is shown.
+        """
+        header(title)
+        return st.checkbox('Show', value=expanded, key=title)
+
+    interactive = st.sidebar.checkbox('Interactive charts')
+
+    def show(func, *args, container=st):
+        """Display a statplots figure, rendered in the worker pool only if it is not in the figure cache.
+        With interactive charts, views with a Vega-Lite version are drawn by the browser instead.
+        """
+        with instrument.stage(f'figure {func.__name__}'):
+            if interactive and hasattr(vega, func.__name__):
+                spec = vega.chart(getattr(vega, func.__name__), *args, version=version)
+                container.vega_lite_chart(spec=spec, use_container_width=True)
+            else:
+                renderer.show(container.empty(), func, *args)
 
     # SUMMARY
-    summary.pyplot(plot_comfort_cat_summary_temp(get_data()), caption='Monitoring Periods')
+    stats = registry.get('comfort_stats')
+    portfolio = registry.get('portfolio')['MOBISTYLE']
+    options = summary.beta_expander('Portfolio')
+    worst_first = options.checkbox('Worst comfort first (MOBISTYLE period)')
+    buildings = options.multiselect('Buildings', sorted(set(room_buildings.values())))
+    page_size = options.number_input('Rooms shown', 1, len(room_lst), min(PAGE_SIZE, len(room_lst)))
+    rooms = rank_rooms(portfolio, worst_first, buildings)
+    page = options.number_input('Page', 1, n_pages(len(rooms), page_size), 1) if len(rooms) > page_size else 1
+    rooms = page_rooms(rooms, page, page_size)
+    options.dataframe(portfolio.loc[rooms])
+    if options.checkbox('Custom period'):
+        dates = options.date_input('Date range', (pd.Timestamp(MS_start), pd.Timestamp(MS_end) - pd.Timedelta('1D')))
+        if len(dates) == 2:
+            # Only the months of the range are read, of the rooms on this page
+            start, end = pd.Timestamp(dates[0]), pd.Timestamp(dates[1]) + pd.Timedelta('1D')
+            custom = pd.concat([period_stats(room, start, end) for room in rooms], ignore_index=True)
+            table = summary_table(custom, 'Temperature', CUSTOM, rooms)
+            options.write(f'Time distribution (%) in comfort categories. Temperature (Room Occupied), '
+                          f'{dates[0]} - {dates[1]}')
+            options.dataframe(table.rename(index=dict(zip(room_lst, room_names))))
+    show(plot_comfort_cat_summary_temp, stats, rooms, container=summary)
     # ROOM SELECTION
     room_name = st.selectbox('', room_names)
+    room = room_dct[room_name]
 
     # ROOM VISUALIZATION
     if st.checkbox('Room description'):
+        room_info = registry.get('room_info').reindex(room_lst)
+        room_info = room_info.rename(index=dict(zip(room_lst, room_names))).replace({np.nan: None})
         st.write("""         
         Dates for giving the MOBISTYLE mobile app to office employees, number of employees, office space area and type,
         window orientation are described in the table below. LED sensors are mounted on the wall. 
@@ -80,102 +95,129 @@ def app():
         """)
         st.table(room_info.loc[room_name, ])
 
-    st.header('IAQ parameters')
-
-    # Load DataFrame for selected room
-    data = get_data()[room_dct[room_name]]
-
-    # Join on Index with outdoor data
-    df = data.join(outdoor_data.iloc[:, :-1])
-    # Daily data
-    df_daily = (df.groupby(['Monitoring_Period', 'Season'])
-                  .resample('D').mean().dropna(how='all').reset_index().set_index('Timestamp'))
-
-    option_iaq = st.selectbox('', options=['Temperature', 'RH', 'CO2 levels', 'VOC levels'])
-    if option_iaq == 'Temperature':
-        st.pyplot(boxplot_monthly_temp(df, room_name))
-        if st.checkbox('Outdoor Temperature'):
-            st.pyplot(plot_t_out(outdoor_data, 'Outdoor Temperature'))
-
-    if option_iaq == 'RH':
-        st.pyplot(boxplot_monthly_rh(df, room_name))
-        if st.checkbox('Outdoor RH'):
-            st.pyplot(plot_t_out(outdoor_data, 'Outdoor RH'))
-
-    if option_iaq == 'CO2 levels':
-        st.pyplot(boxplot_monthly_co2(df, room_name))
-        st.write('Comfort category IV+ corresponds to $CO_2$ concentration levels above *1200 ppm*.')
-    if option_iaq == 'VOC levels':
-        st.pyplot(boxplot_monthly_voc(df, room_name))
-        st.write('Comfort category IV+ corresponds to *VOC* concentration levels above *100 ppb*.')
-
-    st.header('Outdoor and Office temperature')
-
-    def hexbin(x, y, color, **kwargs):
-        """Function to plot Hexbin using FacetGrid."""
-        cmap = sns.light_palette(color, as_cmap=True)
-        plt.hexbin(x, y, gridsize=20, cmap=cmap, **kwargs)
-
-    # Plot by Monitoring period
-    with sns.axes_style("white"):
-        g = sns.FacetGrid(df, hue='Monitoring_Period', col='Monitoring_Period', height=4)
-        (g.map(hexbin, 'Temperature', 'Outdoor Temperature', extent=[15, 30, -5, 35])
-         .set_axis_labels('Office Temperature ($^o$C)', 'Outdoor Temperature ($^o$C)'))
-        st.pyplot(g)
-
-    # Plot by Monitoring period and Season
-    if st.checkbox('Seasonal comparison'):
-        with sns.axes_style("white"):
-            g = sns.FacetGrid(df, hue='Monitoring_Period', col='Monitoring_Period', row='Season', height=4)
-            (g.map(hexbin, 'Temperature', 'Outdoor Temperature', extent=[15, 30, -5, 35])
-             .set_axis_labels('Office Temperature ($^o$C)', 'Outdoor Temperature ($^o$C)'))
-            st.pyplot(g)
-
-    st.subheader('Thermal comfort categories')
-    st.write("Indoor climate data is binned and categorized into comfort categories for a better visual representation "
-             "according to European norm EN 15251:2007.")
-
-    st.pyplot(plot_comfort_cat_temp_rh(df, room_name, 'Temperature'))
-    st.pyplot(plot_comfort_cat_temp_rh(df, room_name, 'RH'))
-
-    category_limits(2)
-
-    g = sns.catplot(x='Category_TEMP', hue='Monitoring_Period', col='Season',
-                    data=df, kind='count', order=labels_T_RH, legend=False, legend_out=True,
-                    height=3.5, aspect=1.5)
-    (g.set_axis_labels("Comfort category", "Count")
-     .add_legend(loc='upper right', fontsize=14))
-    # st.pyplot(g)
-
-    st.header('Air quality categories')
-    st.pyplot(plot_comfort_cat_co2_voc(df, room_name, 'CO2'))
-    st.pyplot(plot_comfort_cat_co2_voc(df, room_name, 'VOC'))
-    category_limits(3)
-
-    st.header('Open window detection')
-    # option_user = st.selectbox('', options=['Window opening count', 'Room occupied time', 'Window open time'])
-    st.pyplot(plot_monthly_window(df, room_name))
-    st.pyplot(plot_window_temp_out(df_daily, room_name))
-
-    st.header('Correlation Heatmap')
-
-    col1, col2 = st.beta_columns(2)
-    with col1:
-        st.pyplot(plot_corr_matrix(df_daily, room_name, 'BASELINE'))
-    with col2:
-        st.pyplot(plot_corr_matrix(df_daily, room_name, 'MOBISTYLE'))
+    if section('IAQ parameters', expanded=True):
+        box_stats = registry.get('box_stats')
+        option_iaq = st.selectbox('', options=['Temperature', 'RH', 'CO2 levels', 'VOC levels'])
+        if option_iaq == 'Temperature':
+            show(boxplot_monthly_temp, box_stats, room_name)
+            if st.checkbox('Outdoor Temperature'):
+                show(plot_t_out, box_stats, 'Outdoor Temperature')
+
+        if option_iaq == 'RH':
+            show(boxplot_monthly_rh, box_stats, room_name)
+            if st.checkbox('Outdoor RH'):
+                show(plot_t_out, box_stats, 'Outdoor RH')
+
+        if option_iaq == 'CO2 levels':
+            show(boxplot_monthly_co2, box_stats, room_name)
+            st.write('Comfort category IV+ corresponds to $CO_2$ concentration levels above *1200 ppm*.')
+        if option_iaq == 'VOC levels':
+            show(boxplot_monthly_voc, box_stats, room_name)
+            st.write('Comfort category IV+ corresponds to *VOC* concentration levels above *100 ppb*.')
+
+    if section('Outdoor and Office temperature', expanded=True):
+        if st.checkbox('Time series'):
+            show(plot_temp, time_series(room, vega.SERIES_BUCKETS if interactive else n_buckets(11.7)), room_name)
+
+        # Plot by Monitoring period
+        grids = registry.get(f'density_{room}')
+        show(plot_density_temp, grids, room_name)
+
+        # Plot by Monitoring period and Season
+        if st.checkbox('Seasonal comparison'):
+            show(plot_density_temp, grids, room_name, True)
+
+    if section('Thermal comfort categories', header=st.subheader):
+        st.write("Indoor climate data is binned and categorized into comfort categories for a better visual "
+                 "representation according to European norm EN 15251:2007.")
+
+        show(plot_comfort_cat_temp_rh, stats, room_name, 'Temperature')
+        show(plot_comfort_cat_temp_rh, stats, room_name, 'RH')
+
+        category_limits(2)
+
+    if section('Air quality categories'):
+        show(plot_comfort_cat_co2_voc, stats, room_name, 'CO2')
+        show(plot_comfort_cat_co2_voc, stats, room_name, 'VOC')
+        category_limits(3)
+
+    if section('What-if category limits'):
+        st.write('Time distribution (%) in comfort categories with other category limits, '
+                 'e.g. CO2 limits of 1000 instead of 1200 ppm or other temperature limits in the cooling season.')
+        parameter = st.selectbox('Parameter', list(PARAMETERS))
+        limits_text = st.text_input('Category limits', ', '.join(f'{limit:g}' for limit in LIMITS[parameter]))
+        change = {ALL: limits_text.split(',')}
+        if parameter == 'Temperature' and st.checkbox('Cooling season limits (EN 15251)'):
+            change['COOLING'] = st.text_input('Cooling season limits',
+                                              ', '.join(f'{limit:g}' for limit in COOLING_TEMP)).split(',')
+        try:
+            what_if = what_if_stats(limit_set({parameter: change}))
+        except ValueError as error:
+            st.error(f'Invalid limits: {error}')
+        else:
+            period = st.radio('Monitoring period', ['BASELINE', 'MOBISTYLE'], index=1)
+            table = summary_table(what_if, parameter, period, rooms)
+            st.dataframe(table.rename(index=dict(zip(room_lst, room_names))))
+            st.write('Change (percentage points) against the current limits')
+            labels = PARAMETERS[parameter][1] + ['Missing data']
+            current = summary_table(stats, parameter, period, rooms)
+            st.dataframe((table[labels] - current[labels]).rename(index=dict(zip(room_lst, room_names))))
+            st.write(f'By season. {room_name}')
+            st.table(category_table(what_if, room, parameter, period).round(1))
+
+    if section('Open window detection'):
+        # option_user = st.selectbox('', options=['Window opening count', 'Room occupied time', 'Window open time'])
+        show(plot_monthly_window, registry.get(f'window_{room}'), room_name)
+        show(plot_window_temp_out, registry.get(f'daily_{room}'), room_name)
+        if st.checkbox('Opening episodes'):
+            st.write('Median duration, occupancy and change of the indoor $CO_2$ and temperature per window opening.')
+            st.table(episode_summary(registry.get(f'episodes_{room}')))
+
+    if section('Correlation Heatmap'):
+        corrs = registry.get(f'corr_{room}')
+        col1, col2 = st.beta_columns(2)
+        with col1:
+            show(plot_corr_matrix, corrs, room_name, 'BASELINE')
+        with col2:
+            show(plot_corr_matrix, corrs, room_name, 'MOBISTYLE')
+
+        if st.checkbox('Compare rooms'):
+            variables = list(corrs.columns)
+            col1, col2 = st.beta_columns(2)
+            x = col1.selectbox('First variable', variables, index=variables.index('Window State'))
+            y = col2.selectbox('Second variable', variables, index=variables.index('Outdoor Temperature'))
+            show(plot_corr_rooms, cross_room(registry.get('correlations'), x, y), x, y)
 
     # OUTDOOR CLIMATE
-    if st.button('Outdoor climate'):
-        # st.subheader('Outdoor climate')
+    # A checkbox instead of a button, the section stays open while the base temperatures are changed
+    if section('Outdoor climate'):
         option_out = st.selectbox('', options=['Temperature', 'RH', 'Solar radiation', 'Degree-days'])
+        box_stats = registry.get('box_stats')
         if 'Degree-days' in option_out:
-            pass
-            # st.pyplot(plot_hdd(hdd))
+            col1, col2 = st.beta_columns(2)
+            heating = col1.slider('Heating base temperature (°C)', 10., 22., HEATING_BASE, step=.5)
+            cooling = col2.slider('Cooling base temperature (°C)', 18., 28., COOLING_BASE, step=.5)
+            dd = degree_days(heating, cooling)
+            show(plot_hdd, dd, heating, cooling)
+            st.write(f'Window opening per 100 heating degree-days of each monitoring period. {room_name}')
+            st.table(normalized_comparison(dd, registry.get(f'episodes_{room}')))
         elif 'Temperature' in option_out:
-            st.pyplot(plot_t_out(outdoor_data, 'Outdoor Temperature'))
+            show(plot_t_out, box_stats, 'Outdoor Temperature')
         elif 'RH' in option_out:
-            st.pyplot(plot_t_out(outdoor_data, 'Outdoor RH'))
+            show(plot_t_out, box_stats, 'Outdoor RH')
         elif 'Solar radiation' in option_out:
-            st.pyplot(plot_t_out(outdoor_data, 'Global radiation'))
-            st.pyplot(plot_t_out(outdoor_data, 'Diffuse radiation'))
+            show(plot_t_out, box_stats, 'Global radiation')
+            show(plot_t_out, box_stats, 'Diffuse radiation')
+
+    renderer.wait()
+
+    cache_info = st.sidebar.beta_expander('Dataset cache')
+    cache_info.table(registry.report())
+    cache_info.write(figure_cache.report())
+    cache_info.table(registry.memory_report())
+    cache_info.write(f'Warm-up: {warmup.status()}')
+
+    instrument.end_run()
+    if instrument.ENABLED:
+        debug = st.sidebar.beta_expander('Debug: stage timing')
+        debug.table(instrument.report())
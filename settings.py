@@ -0,0 +1,67 @@
+import csv
+import os
+
+# Data location
+DATA_DIR = os.environ.get('MOBISTYLE_DATA_DIR', './Data')
+
+# Set bins and labels
+bins_TEMP, bins_RH = [-10000, 19, 20, 21, 23, 24, 25, 10000], [-10000, 20, 25, 30, 50, 60, 70, 10000]
+bins_CO2, bins_VOC = [-10000, 750, 900, 1200, 10000], [-10000, 40, 80, 100, 10000]
+
+labels_T_RH = ['Cat -IV', 'Cat -III', 'Cat -II', 'Cat I', 'Cat +II', 'Cat +III', 'Cat +IV']
+labels_CO2_VOC = ['Cat I', 'Cat II', 'Cat III', 'Cat IV']
+
+# Room list, from ./Data/rooms.csv (Room_ID, Name, Building) if present
+ROOMS_FILE = os.path.join(DATA_DIR, 'rooms.csv')
+
+
+def read_rooms(path=ROOMS_FILE):
+    """Rooms of the config file as (Room_ID, Name, Building) tuples, in file order."""
+    with open(path, newline='') as f:
+        return [(row['Room_ID'], row['Name'], row['Building']) for row in csv.DictReader(f)]
+
+
+if os.path.exists(ROOMS_FILE):
+    room_config = read_rooms()
+else:
+    room_config = [(room, 'Room %d' % i, room[0]) for i, room in enumerate(
+        ['R3N0808', 'R2N0805', 'K1N0623', 'K3N0605', 'R3N0644', 'K1N0624', 'K3N0618', 'R2N0634'], 1)]
+room_lst = [room for room, _, _ in room_config]
+room_names = [name for _, name, _ in room_config]
+room_dct = dict(zip(room_names, room_lst))
+room_buildings = {room: building for room, _, building in room_config}
+
+# Monitoring periods
+BL_start, BL_end = '2018-02-1', '2019-02-1'
+MS_start, MS_end = '2019-02-1', '2020-02-1'
+
+# Column types and names of the room data files
+room_dtypes = {
+    'LED': 'category',
+    'App': 'category',
+    'Monitoring_Period': 'category',
+    'HEAT_COOL': 'category',
+    'Category_TEMP': 'category',
+    'Category_RH': 'category',
+    'Category_CO2': 'category',
+    'Category_VOC': 'category'
+}
+
+
+def room_columns(room):
+    """Raw column name -> app column name for one room data file."""
+    return {
+        f'{room}_OCC': 'Room Status',
+        f'{room}_WINDOW': 'Window State',
+        f'{room}_WINDOW_Openings': 'Window State Change',
+        f'{room}_INAP_co2': 'CO2',
+        f'{room}_INAP_humidity': 'RH',
+        f'{room}_INAP_voc': 'VOC',
+        f'{room}_TEMP': 'Temperature',
+        'Monitoring_Period': 'Monitoring_Period',
+        'HEAT_COOL': 'Season',
+        'Category_TEMP': 'Category_TEMP',
+        'Category_RH': 'Category_RH',
+        'Category_CO2': 'Category_CO2',
+        'Category_VOC': 'Category_VOC',
+    }
@@ -0,0 +1,244 @@
+"""SQL storage backend for the room data.
+
+All rooms are kept in one `readings` table with the same logical schema as the room data of the
+app (room, timestamp, sensor columns, monitoring period, season and comfort categories).
+Filtering, daily/monthly resampling and category counting run in the database, so only
+aggregates travel to the app: with MOBISTYLE_STORAGE=sql the registry reads the comfort counts,
+daily means and box-plot inputs with these queries. The data version is the row count and last
+timestamp of each room, read at most every MOBISTYLE_DB_VERSION_TTL seconds (default 2).
+Works with SQLite (default, ./Data/mobistyle.db) and Postgres (DATABASE_URL). Connections are
+taken from the engine pool, one engine per database URL.
+
+Copy the room data from ./Data to the database:
+    python sqlstore.py
+"""
+import argparse
+import hashlib
+import os
+import time
+from functools import lru_cache
+
+import pandas as pd
+from sqlalchemy import create_engine, text
+from settings import *
+import datacache
+from comfort_stats import PARAMETERS, PERIODS, MOMENTS
+
+DATABASE_URL = os.environ.get('DATABASE_URL', f"sqlite:///{os.path.join(DATA_DIR, 'mobistyle.db')}")
+POOL_SIZE = int(os.environ.get('MOBISTYLE_DB_POOL_SIZE', 5))
+VERSION_TTL = float(os.environ.get('MOBISTYLE_DB_VERSION_TTL', 2))
+
+# App column -> SQL column
+SQL_COLUMNS = {
+    'Room Status': 'room_status',
+    'Window State': 'window_state',
+    'Window State Change': 'window_state_change',
+    'CO2': 'co2',
+    'RH': 'rh',
+    'VOC': 'voc',
+    'Temperature': 'temperature',
+    'Monitoring_Period': 'monitoring_period',
+    'Season': 'season',
+    'Category_TEMP': 'category_temp',
+    'Category_RH': 'category_rh',
+    'Category_CO2': 'category_co2',
+    'Category_VOC': 'category_voc',
+}
+APP_COLUMNS = {sql: app for app, sql in SQL_COLUMNS.items()}
+NUMERIC = ['Room Status', 'Window State', 'Window State Change', 'CO2', 'RH', 'VOC', 'Temperature']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS readings (
+    room VARCHAR(32) NOT NULL,
+    timestamp TIMESTAMP NOT NULL,
+    room_status REAL, window_state REAL, window_state_change REAL,
+    co2 REAL, rh REAL, voc REAL, temperature REAL,
+    monitoring_period VARCHAR(16), season VARCHAR(16),
+    category_temp VARCHAR(16), category_rh VARCHAR(16), category_co2 VARCHAR(16), category_voc VARCHAR(16),
+    PRIMARY KEY (room, timestamp)
+)
+"""
+
+
+@lru_cache(maxsize=None)
+def get_engine(url=DATABASE_URL):
+    """Pooled engine of a database URL, created once per process."""
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    if url.startswith('sqlite'):
+        return create_engine(url, connect_args={'check_same_thread': False})
+    return create_engine(url, pool_size=POOL_SIZE, max_overflow=2 * POOL_SIZE, pool_pre_ping=True)
+
+
+class SQLStore:
+    def __init__(self, url=DATABASE_URL):
+        self.engine = get_engine(url)
+        self.sqlite = self.engine.dialect.name == 'sqlite'
+        self._version = None
+        self._version_time = None
+
+    def _timestamp(self, value):
+        """Query parameter of a timestamp, SQLite keeps timestamps as ISO text."""
+        value = pd.Timestamp(value)
+        return value.strftime('%Y-%m-%d %H:%M:%S') if self.sqlite else value.to_pydatetime()
+
+    def _bucket(self, freq):
+        """SQL expression of the day ('D') or month ('MS') of the timestamp."""
+        if freq == 'D':
+            return 'date(timestamp)' if self.sqlite else "date_trunc('day', timestamp)"
+        if freq == 'MS':
+            return "strftime('%Y-%m-01', timestamp)" if self.sqlite else "date_trunc('month', timestamp)"
+        raise ValueError(f'Unsupported frequency {freq}, use D or MS')
+
+    def _where(self, room, start, end, occupied):
+        conditions, params = [], {}
+        if room is not None:
+            rooms = [room] if isinstance(room, str) else list(room)
+            conditions.append(f"room IN ({', '.join(f':room{i}' for i in range(len(rooms)))})")
+            params.update({f'room{i}': name for i, name in enumerate(rooms)})
+        if start is not None:
+            conditions.append('timestamp >= :start')
+            params['start'] = self._timestamp(start)
+        if end is not None:
+            conditions.append('timestamp <= :end')
+            params['end'] = self._timestamp(end)
+        if occupied:
+            conditions.append('room_status > 0')
+        return (' WHERE ' + ' AND '.join(conditions)) if conditions else '', params
+
+    def _read(self, query, params):
+        with self.engine.connect() as conn:
+            return pd.read_sql(text(query), conn, params=params)
+
+    def create_schema(self):
+        with self.engine.begin() as conn:
+            conn.execute(text(SCHEMA))
+
+    def write_room(self, room, df, chunksize=10000):
+        """Append room data (app columns, Timestamp index) to the readings table."""
+        table = df.loc[:, list(SQL_COLUMNS)].rename(columns=SQL_COLUMNS)
+        for column in table.select_dtypes('category'):
+            table[column] = table[column].astype(object)
+        table.insert(0, 'timestamp', df.index.strftime('%Y-%m-%d %H:%M:%S') if self.sqlite else df.index)
+        table.insert(0, 'room', room)
+        with self.engine.begin() as conn:
+            table.to_sql('readings', conn, if_exists='append', index=False, chunksize=chunksize)
+
+    def rooms(self):
+        return self._read('SELECT DISTINCT room FROM readings ORDER BY room', {})['room'].tolist()
+
+    def data_version(self):
+        """Fingerprint of the readings table: row count and last timestamp of each room."""
+        now = time.monotonic()
+        if self._version is None or now - self._version_time > VERSION_TTL:
+            df = self._read('SELECT room, COUNT(*) AS n, MAX(timestamp) AS last FROM readings '
+                            'GROUP BY room ORDER BY room', {})
+            self._version = hashlib.sha1(df.to_csv(index=False).encode()).hexdigest()
+            self._version_time = now
+        return self._version
+
+    def load_room(self, room, start=None, end=None, columns=None, occupied=False):
+        """Room data in the app schema, optionally limited to a time range, a subset of columns and
+        the occupied rows.
+        """
+        columns = list(SQL_COLUMNS) if columns is None else columns
+        where, params = self._where(room, start, end, occupied)
+        query = (f"SELECT timestamp, {', '.join(SQL_COLUMNS[column] for column in columns)} "
+                 f"FROM readings{where} ORDER BY timestamp")
+        df = self._read(query, params).rename(columns=APP_COLUMNS)
+        df = df.set_index(pd.DatetimeIndex(df.pop('timestamp'), name='Timestamp'))
+        df = datacache.compact(df)
+        df.index = datacache.shared_index(df.index)
+        return df
+
+    def resample(self, room, freq='D', columns=None, start=None, end=None, occupied=False):
+        """Means and counts of numeric columns per Monitoring period, Season and day/month."""
+        columns = NUMERIC if columns is None else columns
+        where, params = self._where(room, start, end, occupied)
+        bucket = self._bucket(freq)
+        aggregates = ', '.join(f'AVG({SQL_COLUMNS[column]}) AS "{column}"' for column in columns)
+        query = (f'SELECT monitoring_period AS "Monitoring_Period", season AS "Season", {bucket} AS "Timestamp", '
+                 f'COUNT(*) AS "Samples", {aggregates} FROM readings{where} '
+                 f'GROUP BY monitoring_period, season, {bucket} ORDER BY monitoring_period, season, {bucket}')
+        df = self._read(query, params).dropna(subset=['Monitoring_Period', 'Season'])
+        return df.set_index(pd.DatetimeIndex(df.pop('Timestamp')))
+
+    def category_counts(self, parameter, rooms=None, start=None, end=None, occupied=True):
+        """Number of samples per room, Monitoring period, Season and comfort category of `parameter`."""
+        category = SQL_COLUMNS[PARAMETERS[parameter][0]]
+        where, params = self._where(rooms, start, end, occupied)
+        query = (f'SELECT room AS "Room", monitoring_period AS "Monitoring_Period", season AS "Season", '
+                 f'{category} AS "Category", COUNT(*) AS "Count" FROM readings{where} '
+                 f'GROUP BY room, monitoring_period, season, {category}')
+        df = self._read(query, params)
+        df['Category'] = df['Category'].fillna('Missing data')
+        return df.dropna(subset=['Monitoring_Period'])
+
+    def category_percentages(self, parameter, rooms=None, start=None, end=None, occupied=True):
+        """Time distribution (%) in comfort categories per room, Monitoring period and Season."""
+        counts = self.category_counts(parameter, rooms, start, end, occupied).dropna(subset=['Season'])
+        table = counts.pivot_table(index=['Room', 'Monitoring_Period', 'Season'], columns='Category',
+                                   values='Count', aggfunc='sum', fill_value=0)
+        table = table.reindex(columns=PARAMETERS[parameter][1] + ['Missing data'], fill_value=0)
+        return table.div(table.sum(axis=1), axis=0) * 100
+
+    def room_counts(self, room, occupied=True):
+        """Additive counts of one room in the layout of comfort_stats.room_counts, one query per parameter."""
+        where, params = self._where(room, None, None, occupied)
+        tables = []
+        for parameter, (category, labels) in PARAMETERS.items():
+            column, category = SQL_COLUMNS[parameter], SQL_COLUMNS[category]
+            query = (f'SELECT monitoring_period AS "Monitoring_Period", season AS "Season", {category} AS "Category", '
+                     f'COUNT(*) AS "Samples", COUNT({column}) AS "count", SUM({column}) AS "sum", '
+                     f'SUM({column} * {column}) AS "sumsq", MIN({column}) AS "min", MAX({column}) AS "max" '
+                     f'FROM readings{where} GROUP BY monitoring_period, season, {category}')
+            df = self._read(query, params)
+            seasons = sorted(df['Season'].dropna().unique())
+            groups = pd.MultiIndex.from_product([PERIODS, seasons + ['All']], names=['Monitoring_Period', 'Season'])
+            df['Category'] = df['Category'].where(df['Category'].isin(labels), 'Missing data')
+            # Rows without season only count in the whole period ('All' season)
+            df = pd.concat([df.dropna(subset=['Season']), df.assign(Season='All')])
+            counts = df.pivot_table(index=['Monitoring_Period', 'Season'], columns='Category', values='Samples',
+                                    aggfunc='sum').reindex(index=groups, columns=labels + ['Missing data'])
+            moments = df.groupby(['Monitoring_Period', 'Season']).agg(
+                count=('count', 'sum'), sum=('sum', 'sum'), sumsq=('sumsq', 'sum'), min=('min', 'min'),
+                max=('max', 'max')).reindex(groups)
+            table = pd.concat([counts.fillna(0), moments.loc[:, MOMENTS]], axis=1).astype(float)
+            table[['count', 'sum', 'sumsq']] = table[['count', 'sum', 'sumsq']].fillna(0)
+            table.columns.name = 'Statistic'
+            tables.append(pd.concat({parameter: table.stack(dropna=False)}, names=['Parameter']))
+        return pd.concat(tables).rename('Value')
+
+    def daily_data(self, room, outdoor_data=None):
+        """Daily means by Monitoring period and Season as rollups.daily_data, averaged in the database.
+        The outdoor columns are the daily means of all outdoor readings of the day.
+        """
+        df = self.resample(room, 'D').drop(columns='Samples')
+        if outdoor_data is not None:
+            outdoor = outdoor_data.iloc[:, :-1].astype('float64').resample('D').mean()
+            for column in outdoor:
+                df[column] = outdoor[column].reindex(df.index).to_numpy()
+        return df.rename_axis('Timestamp')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Copy the room data to the SQL database.')
+    parser.add_argument('--rooms', nargs='*', default=room_lst, help='room IDs (default: all rooms)')
+    parser.add_argument('--url', default=DATABASE_URL, help='database URL')
+    args = parser.parse_args()
+
+    store = SQLStore(args.url)
+    store.create_schema()
+    present = set(store.rooms())
+    for room in args.rooms:
+        if room in present:
+            print(f'{room} already in the database, skipped')
+            continue
+        start = time.perf_counter()
+        df = datacache.load_room(room)
+        store.write_room(room, df)
+        print(f'{room} {len(df)} rows {time.perf_counter() - start:.1f} s')
+
+
+if __name__ == '__main__':
+    main()
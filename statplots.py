@@ -2,13 +2,13 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
-
-# Set bins and labels
-bins_TEMP, bins_RH = [-10000, 19, 20, 21, 23, 24, 25, 10000], [-10000, 20, 25, 30, 50, 60, 70, 10000]
-bins_CO2, bins_VOC = [-10000, 750, 900, 1200, 10000], [-10000, 40, 80, 100, 10000]
-
-labels_T_RH = ['Cat -IV', 'Cat -III', 'Cat -II', 'Cat I', 'Cat +II', 'Cat +III', 'Cat +IV']
-labels_CO2_VOC = ['Cat I', 'Cat II', 'Cat III', 'Cat IV']
+from settings import *
+from comfort_stats import category_table, summary_table
+from rollups import OUTDOOR
+from density import EXTENT
+from portfolio import PAGE_SIZE
+from correlation import corr_matrix
+from degreedays import HEATING_BASE, COOLING_BASE
 
 # RGB codes for Comfort category colors
 cmap_T_RH = [(0, .33, .82), (0, .7, .82), (.5, .95, .75), (.3, .7, .4),
@@ -26,11 +26,6 @@ color_other = '#2ca02c'
 color_out = '#7f7f7f'
 color_missing = 'lightgrey'
 
-# Room list
-room_lst = ['R3N0808', 'R2N0805', 'K1N0623', 'K3N0605', 'R3N0644', 'K1N0624', 'K3N0618', 'R2N0634']
-room_names = ['Room %d' % i for i in range(1, 9)]
-room_dct = dict(zip(room_names, room_lst))
-
 
 def set_barh_text(df, ax):
     """Function to plot text in the middle of horizontal bar charts.
@@ -44,16 +39,16 @@ def set_barh_text(df, ax):
 
 
 # OUTDOOR CLIMATE
-def plot_hdd(df):
+def plot_hdd(df, heating=HEATING_BASE, cooling=COOLING_BASE):
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(11.7, 8.27), sharex=True)
     df.iloc[:12, :].plot(kind='barh', stacked=True, ax=ax1)
-    df.iloc[12:-1, :].plot(kind='barh', stacked=True, ax=ax2, c=[color_MS, 'salmon'])
+    df.iloc[12:-1, :].plot(kind='barh', stacked=True, ax=ax2, color=[color_MS, 'salmon'])
     set_barh_text(df.iloc[:12, :], ax1)
     set_barh_text(df.iloc[12:-1, :], ax2)
 
     for ax in (ax1, ax2):
-        ax.set(xticklabels=[0, 100, 200, 300, 400, 500, 600], ylabel='')
-        ax.set_xlabel('[count]', size=14)
+        ax.set(ylabel='')
+        ax.set_xlabel('[K day]', size=14)
         ax.tick_params(axis='both', which='major', labelsize=14)
         ax.legend('')
 
@@ -64,7 +59,8 @@ def plot_hdd(df):
     ax2.yaxis.set_label_position('right')
     ax2.yaxis.tick_right()
 
-    plt.suptitle('Heating degree-days (HDD) and cooling degree-days (CDD). Slovenia, Ljubljana', fontsize=14)
+    plt.suptitle(f'Heating degree-days (HDD, base {heating:g} $^o$C) and cooling degree-days '
+                 f'(CDD, base {cooling:g} $^o$C). Slovenia, Ljubljana', fontsize=14)
 
     fig.legend(['HDD', 'CDD'], loc='lower center', bbox_to_anchor=(0.5, 0.0), ncol=2, fontsize=12)
     fig.tight_layout()
@@ -72,7 +68,22 @@ def plot_hdd(df):
     return fig
 
 
-def plot_t_out(df, parameter='Outdoor Temperature'):
+def boxplot_monthly(stats, room, parameter, ax):
+    """Draw monthly box plots of BASELINE and MOBISTYLE from pre-computed box-plot statistics."""
+    stats = stats[(stats['Room'] == room) & (stats['Parameter'] == parameter)]
+    handles = []
+    for period, color, offset in (('BASELINE', color_BL, -.2), ('MOBISTYLE', color_MS, .2)):
+        data = stats[stats['Monitoring_Period'] == period]
+        ax.bxp(data.loc[:, ['whislo', 'q1', 'med', 'q3', 'whishi']].to_dict('records'),
+               positions=data['Month'].to_numpy() - 1 + offset, widths=.38, showfliers=False, patch_artist=True,
+               boxprops={'facecolor': color, 'edgecolor': '.25'}, medianprops={'color': '.25'},
+               whiskerprops={'color': '.25'}, capprops={'color': '.25'}, manage_ticks=False)
+        handles.append(plt.Rectangle((0, 0), 1, 1, facecolor=color, edgecolor='.25', label=period))
+    ax.set(xlim=(-.5, 11.5), xticks=range(12))
+    ax.legend(handles=handles, fontsize=14)
+
+
+def plot_t_out(stats, parameter='Outdoor Temperature'):
     fig, ax = plt.subplots(figsize=(11.7, 4))
     if parameter == 'Outdoor Temperature':
         unit = '[$^o$C]'
@@ -81,10 +92,8 @@ def plot_t_out(df, parameter='Outdoor Temperature'):
     elif parameter == 'Global radiation' or 'Diffuse radiation':
         unit = '[W/m2]'
 
-    sns.boxplot(data=df, x=df.index.month, y=parameter, hue='Monitoring_Period',
-                showfliers=False, palette=[color_BL, color_MS], ax=ax)
+    boxplot_monthly(stats, OUTDOOR, parameter, ax)
     ax.tick_params(axis='both', which='major', labelsize=14)
-    ax.legend(fontsize=14)
     ax.xaxis.grid(True)
     ax.set_title(f'Outdoor Air {parameter}. Slovenia, Ljubljana (Bežigrad)', fontsize=14)
     ax.set_ylabel(unit, fontsize=14)
@@ -97,38 +106,14 @@ def plot_t_out(df, parameter='Outdoor Temperature'):
 
 
 # ROOM VISUALIZATION
-BL_start, BL_end = '2018-02-1', '2019-02-1'
-MS_start, MS_end = '2019-02-1', '2020-02-1'
-
-
-def stats_temp(df, room_name):
-    """This f-n calculates time distribution of indoor air temperature in comfort categories,
-    descriptive statistics (Min, Mean, St.Dev., Max.) and percentage of missing data.
-    """
-    df_T = pd.DataFrame(0, index=[room_name], columns=labels_T_RH + ['min', 'mean', 'std', 'max', 'Missing data'])
-
-    for cat in labels_T_RH:
-        df_T.loc[room_name, cat] = round(df['Category_TEMP'].isin([cat]).sum() * 100 / len(df['Category_TEMP']), 1)
-
-    df_T.loc[room_name, 'Missing data'] = round(df['Category_TEMP'].isna().sum() * 100 / len(df['Category_TEMP']), 1)
-
-    df_T.loc[room_name, ['max', 'mean', 'std', 'min']] = round(
-        df['Temperature'].agg(['min', 'mean', 'std', 'max']), 1)
-    return df_T.fillna(0)
-
-
-def plot_comfort_cat_summary_temp(data_dct):
-    all_BL, all_MS = [], []
-    for name, val in data_dct.items():
-        all_BL.append(stats_temp(val.loc[BL_start:BL_end, :].query('`Room Status` > 0'), name))
-        all_MS.append(stats_temp(val.loc[MS_start:MS_end, :].query('`Room Status` > 0'), name))
-        all_stats_BL = pd.concat(all_BL, sort=False)
-        all_stats_MS = pd.concat(all_MS, sort=False)
-
-    all_stats_BL = all_stats_BL.iloc[::-1].rename(index=dict(zip(room_lst, room_names)))
-    all_stats_MS = all_stats_MS.iloc[::-1].rename(index=dict(zip(room_lst, room_names)))
-
-    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(11.7, 6))
+def plot_comfort_cat_summary_temp(stats, rooms=None):
+    rooms = room_lst[:PAGE_SIZE] if rooms is None else rooms
+    all_stats_BL = summary_table(stats, 'Temperature', 'BASELINE', rooms).iloc[::-1]
+    all_stats_MS = summary_table(stats, 'Temperature', 'MOBISTYLE', rooms).iloc[::-1]
+    all_stats_BL = all_stats_BL.rename(index=dict(zip(room_lst, room_names)))
+    all_stats_MS = all_stats_MS.rename(index=dict(zip(room_lst, room_names)))
+
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(11.7, max(6, .45 * len(rooms) + 2.4)))
     all_stats_BL.loc[:, labels_T_RH + ['Missing data']].plot(kind='barh', stacked=True, color=cmap_T_RH, ax=ax1)
     all_stats_MS.loc[:, labels_T_RH + ['Missing data']].plot(kind='barh', stacked=True, color=cmap_T_RH, ax=ax2)
 
@@ -154,10 +139,11 @@ def plot_comfort_cat_summary_temp(data_dct):
 
 
 # INDOOR CLIMATE
-def plot_temp(df):
+def plot_temp(df, room_name=None):
+    # df is decimated to the figure width (registry.time_series)
     fig, ax = plt.subplots(figsize=(11.7, 4), sharex=True)
-    df.loc[:, ['Temperature', 'Outdoor Temperature']].plot(color=['darkblue', 'grey'],
-                                                           linewidth=.4, ax=ax)
+    df = df.loc[:, ['Temperature', 'Outdoor Temperature']]
+    df.plot(color=['darkblue', 'grey'], linewidth=.4, ax=ax)
     ax.axvline(x='02-01-2019', color='orange', linestyle='--', linewidth=1)
     ax.fill_between(df.loc['02-01-2019':, :].index.values, -15, 40, facecolor=color_MS, alpha=0.1)
     ax.fill_between(df.loc[:'02-01-2019', :].index.values, -15, 40, facecolor=color_BL, alpha=0.1)
@@ -168,17 +154,14 @@ def plot_temp(df):
            ylabel='($^o$C)')
     ax.set_xticklabels(pd.date_range(start='2018-02-1', periods=13, freq='2MS').strftime('%b, %Y'), rotation=90)
     ax.legend(['Office Temperature', 'Outdoor Temperature'], loc='lower right')
+    if room_name:
+        ax.set_title(f'Office and outdoor temperature. {room_name}', fontsize=14)
     return fig
 
 
-def boxplot_monthly_temp(df, room_name):
+def boxplot_monthly_temp(stats, room_name):
     fig, ax = plt.subplots(figsize=(11.7, 4))
-    data = (df.query('`Room Status` > 0').loc[:, ['Temperature']])
-    data.loc[BL_start: BL_end, 'Monitoring_Period'] = 'BASELINE'
-    data.loc[MS_start: MS_end, 'Monitoring_Period'] = 'MOBISTYLE'
-    sns.boxplot(data=data,
-                x=data.index.month, y='Temperature', hue='Monitoring_Period',
-                showfliers=False, palette=[color_BL, color_MS], ax=ax)
+    boxplot_monthly(stats, room_dct[room_name], 'Temperature', ax)
 
     ax.axhline(y=25, xmax=0.35, color=(.3, .7, .4), linestyle='--', linewidth=1)
     ax.axhline(y=21, xmax=0.35, color=(.3, .7, .4), linestyle='--', linewidth=1)
@@ -190,7 +173,6 @@ def boxplot_monthly_temp(df, room_name):
     ax.axhline(y=21, xmin=0.75, color=(.3, .7, .4), linestyle='--', linewidth=1)
 
     ax.tick_params(axis='both', which='major', labelsize=14)
-    ax.legend(fontsize=14)
     ax.xaxis.grid(True)
     ax.set_title(f'Indoor air temperature (Room Occupied). {room_name}', fontsize=14)
     ax.set_ylabel('[$^o$C]', fontsize=14)
@@ -200,21 +182,15 @@ def boxplot_monthly_temp(df, room_name):
     return fig
 
 
-def boxplot_monthly_rh(df, room_name):
+def boxplot_monthly_rh(stats, room_name):
     fig, ax = plt.subplots(figsize=(11.7, 4))
-    data = (df.query('`Room Status` > 0').loc[:, ['RH']])
-    data.loc[BL_start: BL_end, 'Monitoring_Period'] = 'BASELINE'
-    data.loc[MS_start: MS_end, 'Monitoring_Period'] = 'MOBISTYLE'
-    sns.boxplot(data=data,
-                x=data.index.month, y='RH', hue='Monitoring_Period',
-                showfliers=False, palette=[color_BL, color_MS], ax=ax)
+    boxplot_monthly(stats, room_dct[room_name], 'RH', ax)
 
     ax.axhline(y=60, color=(.3, .7, .4), linestyle='--', linewidth=1)
     ax.axhline(y=30, color=(.3, .7, .4), linestyle='--', linewidth=1)
     ax.text(x=-.5, y=61, s='Comfort cat. II+', color=(.3, .7, .4), size=12)
     ax.text(x=-.5, y=31, s='Comfort cat. II-', color=(.3, .7, .4), size=12)
     ax.tick_params(axis='both', which='major', labelsize=14)
-    ax.legend(fontsize=14)
     ax.xaxis.grid(True)
     ax.set_title(f'Indoor air Relative Humidity levels (Room Occupied). {room_name}', fontsize=14)
     ax.set_ylabel('[%]', fontsize=14)
@@ -224,18 +200,12 @@ def boxplot_monthly_rh(df, room_name):
     return fig
 
 
-def boxplot_monthly_co2(df, room_name):
+def boxplot_monthly_co2(stats, room_name):
     fig, ax = plt.subplots(figsize=(11.7, 4))
-    data = (df.query('`Room Status` > 0').loc[:, ['CO2']])
-    data.loc[BL_start: BL_end, 'Monitoring_Period'] = 'BASELINE'
-    data.loc[MS_start: MS_end, 'Monitoring_Period'] = 'MOBISTYLE'
-    sns.boxplot(data=data,
-                x=data.index.month, y='CO2', hue='Monitoring_Period',
-                showfliers=False, palette=[color_BL, color_MS], ax=ax)
+    boxplot_monthly(stats, room_dct[room_name], 'CO2', ax)
     ax.axhline(y=1200, color=(.8, .07, .25), linestyle='--', linewidth=1)
     ax.text(x=-.5, y=1250, s='Comfort cat. IV+', color=(.8, .07, .25), size=12)
     ax.tick_params(axis='both', which='major', labelsize=14)
-    ax.legend(fontsize=14)
     ax.xaxis.grid(True)
     ax.set_title(f'Indoor air CO2 levels (Room Occupied). {room_name}', fontsize=14)
     ax.set_ylabel('[ppm]', fontsize=14)
@@ -245,18 +215,12 @@ def boxplot_monthly_co2(df, room_name):
     return fig
 
 
-def boxplot_monthly_voc(df, room_name):
+def boxplot_monthly_voc(stats, room_name):
     fig, ax = plt.subplots(figsize=(11.7, 4))
-    data = (df.query('`Room Status` > 0').loc[:, ['VOC']])
-    data.loc[BL_start: BL_end, 'Monitoring_Period'] = 'BASELINE'
-    data.loc[MS_start: MS_end, 'Monitoring_Period'] = 'MOBISTYLE'
-    sns.boxplot(data=data,
-                x=data.index.month, y='VOC', hue='Monitoring_Period',
-                showfliers=False, palette=[color_BL, color_MS], ax=ax)
+    boxplot_monthly(stats, room_dct[room_name], 'VOC', ax)
     ax.axhline(y=100, color=(.8, .07, .25), linestyle='--', linewidth=1)
     ax.text(x=-.5, y=105, s='Comfort cat. IV+', color=(.8, .07, .25), size=12)
     ax.tick_params(axis='both', which='major', labelsize=14)
-    ax.legend(fontsize=14)
     ax.xaxis.grid(True)
     ax.set_title(f'Indoor air VOC levels (Room Occupied). {room_name}', fontsize=14)
     ax.set_ylabel('[ppb]', fontsize=14)
@@ -266,36 +230,32 @@ def boxplot_monthly_voc(df, room_name):
     return fig
 
 
-# THERMAL COMFORT
-def stats_category(df, cat_name):
-    """
-    This f-n calculates time distribution of indoor air parameters in comfort categories
-    and percentage of missing data.
-    """
-    if cat_name in ('Category_TEMP', 'Category_RH'):
-        df_cat = pd.DataFrame(0, index=[cat_name], columns=labels_T_RH + ['Missing data'])
-        for cat in labels_T_RH:
-            df_cat.loc[cat_name, cat] = df[cat_name].isin([cat]).sum() * 100 / len(df[cat_name])
-    else:
-        df_cat = pd.DataFrame(0, index=[cat_name], columns=labels_CO2_VOC + ['Missing data'])
-        for cat in labels_CO2_VOC:
-            df_cat.loc[cat_name, cat] = df[cat_name].isin([cat]).sum() * 100 / len(df[cat_name])
-    df_cat.loc[cat_name, 'Missing data'] = df[cat_name].isna().sum() * 100 / len(df[cat_name])
-
-    return df_cat.fillna(0)
+def plot_density_temp(grids, room_name, seasonal=False):
+    """Office vs Outdoor temperature density by Monitoring period, optionally split by Season."""
+    seasons = sorted({season for _, season in grids if season != 'All'}) if seasonal else ['All']
+    with sns.axes_style("white"):
+        fig, axes = plt.subplots(len(seasons), 2, figsize=(8, 4 * len(seasons)), sharex=True, sharey=True,
+                                 squeeze=False)
+        for row, season in zip(axes, seasons):
+            for ax, period, color in zip(row, ['BASELINE', 'MOBISTYLE'], [color_BL, color_MS]):
+                ax.imshow(grids[(period, season)].T, origin='lower', extent=EXTENT, aspect='auto',
+                          interpolation='nearest', cmap=sns.light_palette(color, as_cmap=True))
+                ax.set_title(f'Season = {season} | {period}' if seasonal else f'Monitoring_Period = {period}')
+            row[0].set_ylabel('Outdoor Temperature ($^o$C)')
+        for ax in axes[-1]:
+            ax.set_xlabel('Office Temperature ($^o$C)')
+        sns.despine(fig)
+        fig.suptitle(f'Office and Outdoor temperature. {room_name}', fontsize=14)
+        fig.tight_layout()
+        fig.subplots_adjust(top=0.85 if not seasonal else 0.92)
+    return fig
 
 
-def plot_comfort_cat_temp_rh(df, room_name, parameter):
+# THERMAL COMFORT
+def plot_comfort_cat_temp_rh(stats, room_name, parameter):
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(11.7, 4), sharey=True)
-    if parameter == 'Temperature':
-        category_name = 'Category_TEMP'
-    else:
-        category_name = 'Category_RH'
-    df_cat = (df.query('`Room Status` > 0')
-                .groupby(['Monitoring_Period', 'Season']).apply(stats_category, category_name)
-                .reset_index().set_index('Season'))
-    BL_T = df_cat.query('Monitoring_Period == "BASELINE"').loc[:, labels_T_RH + ['Missing data']]
-    MS_T = df_cat.query('Monitoring_Period == "MOBISTYLE"').loc[:, labels_T_RH + ['Missing data']]
+    BL_T = category_table(stats, room_dct[room_name], parameter, 'BASELINE')
+    MS_T = category_table(stats, room_dct[room_name], parameter, 'MOBISTYLE')
     BL_T.plot(kind='barh', stacked=True, color=cmap_T_RH, legend='', ax=ax1)
     MS_T.plot(kind='barh', stacked=True, color=cmap_T_RH, legend='', ax=ax2)
     set_barh_text(BL_T, ax1)
@@ -313,18 +273,10 @@ def plot_comfort_cat_temp_rh(df, room_name, parameter):
     return fig
 
 
-def plot_comfort_cat_co2_voc(df, room_name, parameter):
+def plot_comfort_cat_co2_voc(stats, room_name, parameter):
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(11.7, 4), sharey=True)
-    if parameter == 'CO2':
-        category_name = 'Category_CO2'
-    else:
-        category_name = 'Category_VOC'
-    df_cat = (df.query('`Room Status` > 0')
-                .groupby(['Monitoring_Period', 'Season']).apply(stats_category, category_name)
-                .reset_index().set_index('Season')
-              )
-    BL_T = df_cat.query('Monitoring_Period == "BASELINE"').loc[:, labels_CO2_VOC + ['Missing data']]
-    MS_T = df_cat.query('Monitoring_Period == "MOBISTYLE"').loc[:, labels_CO2_VOC + ['Missing data']]
+    BL_T = category_table(stats, room_dct[room_name], parameter, 'BASELINE')
+    MS_T = category_table(stats, room_dct[room_name], parameter, 'MOBISTYLE')
     BL_T.plot(kind='barh', stacked=True, color=cmap_CO2_VOC, legend='', ax=ax1)
     MS_T.plot(kind='barh', stacked=True, color=cmap_CO2_VOC, legend='', ax=ax2)
     set_barh_text(BL_T, ax1)
@@ -344,10 +296,10 @@ def plot_comfort_cat_co2_voc(df, room_name, parameter):
 
 
 # WINDOW OPENINGS
-def plot_monthly_window(df, room_name):
+def plot_monthly_window(window, room_name):
     fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(11.7, 8), sharex=True)
-    df_OP = df[['Window State Change']].resample('MS').apply(lambda x: x.isin([1]).sum())
-    df_OP['Window_State'] = df[['Window State']].resample('MS').mean() * 100
+    df_OP = window[['Openings']].rename(columns={'Openings': 'Window State Change'})
+    df_OP['Window_State'] = window['Open'] / window['Samples'].where(window['Samples'] > 0) * 100
     df_OP.loc[:'2019-02-1', 'Monitoring_Period'] = 'BASELINE'
     df_OP.loc['2019-02-1':, 'Monitoring_Period'] = 'MOBISTYLE'
 
@@ -386,16 +338,14 @@ def plot_window_temp_out(df, room_name):
 
 
 # CORRELATION MATRIX
-def plot_corr_matrix(df, room_name, period):
-    mask_period = (df['Monitoring_Period'] == period)
-    df = df.query('`Room Status` > 0').loc[mask_period, ]
-    df = df.drop(columns=['Room Status', 'Season', 'Monitoring_Period', 'Diffuse radiation', 'Window State Change'])
+def plot_corr_matrix(corrs, room_name, period):
+    corr = corr_matrix(corrs, period)
     fig, ax = plt.subplots(figsize=(11.7, 8.27))
 
-    mask = np.zeros_like(df.corr(method='spearman'))
+    mask = np.zeros_like(corr)
     mask[np.triu_indices_from(mask)] = True
-    labels = [col.replace('_', ' ') for col in df.columns]
-    hm = sns.heatmap(df.corr(method='spearman'), square=True,
+    labels = [col.replace('_', ' ') for col in corr.columns]
+    hm = sns.heatmap(corr, square=True,
                      cmap='RdBu_r', linewidths=.5, annot=True, fmt='.2f',
                      xticklabels=labels, yticklabels=labels,
                      mask=mask, vmax=1., vmin=-1., ax=ax)
@@ -406,6 +356,14 @@ def plot_corr_matrix(df, room_name, period):
     return fig
 
 
-
-
-
+def plot_corr_rooms(table, x, y):
+    fig, ax = plt.subplots(figsize=(11.7, max(4, .4 * len(table) + 1.5)))
+    table.iloc[::-1].plot(kind='barh', color=[color_BL, color_MS], ax=ax)
+    ax.axvline(x=0, color='grey', linewidth=1)
+    ax.set(xlim=(-1, 1), ylabel='')
+    ax.set_xlabel('Spearman correlation coefficient', fontsize=14)
+    ax.tick_params(axis='both', which='major', labelsize=14)
+    ax.set_title(f'Correlation of {x} and {y} (daily data, room occupied)', fontsize=14)
+    ax.legend(loc='lower right', fontsize=12)
+    fig.tight_layout()
+    return fig
@@ -0,0 +1,147 @@
+"""Synthetic data set with the schema of the ./Data files.
+
+Room files Data_{room}.csv have the raw columns read by the app ({room}_OCC, {room}_WINDOW,
+{room}_WINDOW_Openings, {room}_INAP_co2, ... , Monitoring_Period, HEAT_COOL and the comfort
+categories), outdoor_data.csv has the outdoor climate and rooms.csv the room list. The metadata
+files (room_info.xlsx, HDDs_SL.xlsx, comfort_categories.xlsx) are copied from ./Data. Values follow daily, weekly and
+yearly cycles with noise and missing samples, the categories are binned with the app bins.
+
+Write two years of 15-minute data of all rooms:
+    python synthetic.py ./SyntheticData --years 2
+"""
+import argparse
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+from settings import *
+
+START = '2018-01-01'
+FREQ = '15min'
+METADATA = ['room_info.xlsx', 'HDDs_SL.xlsx', 'comfort_categories.xlsx']
+ROOMS_PER_BUILDING = 50
+MISSING = .03
+
+
+def timestamps(start=START, years=2, freq=FREQ):
+    """Sampling times of `years` years and one month, the span of the monitoring data."""
+    end = pd.Timestamp(start) + pd.DateOffset(years=years, months=1)
+    return pd.date_range(start, end, freq=freq, name='Timestamp')[:-1]
+
+
+def yearly(index, peak_day=200):
+    """Yearly cycle between -1 (winter) and 1 (summer)."""
+    return np.cos(2 * np.pi * (index.dayofyear.to_numpy() - peak_day) / 365.25)
+
+
+def daily(index, peak_hour=14):
+    hour = index.hour.to_numpy() + index.minute.to_numpy() / 60
+    return np.cos(2 * np.pi * (hour - peak_hour) / 24)
+
+
+def with_missing(values, rng):
+    values = values.astype(float)
+    values[rng.random(len(values)) < MISSING] = np.nan
+    return values
+
+
+def generate_outdoor(start=START, years=2, freq=FREQ, seed=0):
+    """Outdoor temperature, RH and solar radiation."""
+    index = timestamps(start, years, freq)
+    rng = np.random.default_rng(seed)
+    n = len(index)
+    temperature = 10 + 9 * yearly(index) + 4 * daily(index) + np.cumsum(rng.normal(0, .1, n)) % 4 - 2
+    sun = np.clip(daily(index, 12), 0, None) * (.6 + .4 * yearly(index))
+    global_radiation = np.round(700 * sun * rng.uniform(.3, 1, n), 1)
+    return pd.DataFrame({
+        'Temperature': np.round(temperature, 2),
+        'RH': np.round(np.clip(78 - 12 * yearly(index) - 10 * daily(index) + rng.normal(0, 5, n), 20, 100), 1),
+        'Global radiation': global_radiation,
+        'Diffuse radiation': np.round(global_radiation * rng.uniform(.2, .6, n), 1),
+    }, index=index)
+
+
+def generate_room(room, outdoor, seed=0):
+    """Raw room data file of `room` over the period of the outdoor data."""
+    index = outdoor.index
+    rng = np.random.default_rng(seed)
+    n = len(index)
+
+    working = (index.dayofweek.to_numpy() < 5) & (index.hour.to_numpy() >= 8) & (index.hour.to_numpy() < 17)
+    occupied = working & (rng.random(n) < .8)
+    summer = yearly(index) > .3
+    window = (rng.random(n) < np.where(summer, .2, .03)) & occupied
+    # Open windows stay open for a few samples
+    window = pd.Series(window).rolling(4, min_periods=1).max().to_numpy()
+    outdoor_temperature = outdoor['Temperature'].to_numpy()
+
+    temperature = 22 + .15 * (outdoor_temperature - 10) + 1.2 * occupied - .8 * window + rng.normal(0, .5, n)
+    co2 = 420 + np.where(occupied, rng.uniform(200, 900, n), rng.uniform(0, 100, n)) * (1 - .5 * window)
+    rh = np.clip(45 + 12 * yearly(index) + 3 * occupied + rng.normal(0, 4, n), 10, 90)
+    voc = np.clip(20 + 40 * occupied + rng.gamma(2, 10, n), 0, None)
+
+    df = pd.DataFrame({
+        f'{room}_OCC': occupied.astype(float),
+        f'{room}_WINDOW': window,
+        f'{room}_WINDOW_Openings': np.diff(window, prepend=0),
+        f'{room}_INAP_co2': np.round(with_missing(co2, rng), 1),
+        f'{room}_INAP_humidity': np.round(with_missing(rh, rng), 1),
+        f'{room}_INAP_voc': np.round(with_missing(voc, rng), 1),
+        f'{room}_TEMP': np.round(with_missing(temperature, rng), 2),
+        'LED': (index >= MS_start).astype(int),
+        'App': (index >= MS_start).astype(int),
+    }, index=index)
+    df.loc[BL_start: BL_end, 'Monitoring_Period'] = 'BASELINE'
+    df.loc[MS_start: MS_end, 'Monitoring_Period'] = 'MOBISTYLE'
+    df['HEAT_COOL'] = np.where(index.month.isin([5, 6, 7, 8, 9]), 'COOLING', 'HEATING')
+    df['Category_TEMP'] = pd.cut(df[f'{room}_TEMP'], bins_TEMP, labels=labels_T_RH)
+    df['Category_RH'] = pd.cut(df[f'{room}_INAP_humidity'], bins_RH, labels=labels_T_RH)
+    df['Category_CO2'] = pd.cut(df[f'{room}_INAP_co2'], bins_CO2, labels=labels_CO2_VOC)
+    df['Category_VOC'] = pd.cut(df[f'{room}_INAP_voc'], bins_VOC, labels=labels_CO2_VOC)
+    return df
+
+
+def room_ids(n_rooms):
+    """IDs of `n_rooms` synthetic rooms, ROOMS_PER_BUILDING rooms per building."""
+    return [f'B{i // ROOMS_PER_BUILDING + 1}N{i:04d}' for i in range(n_rooms)]
+
+
+def write_rooms(output_dir, rooms):
+    pd.DataFrame({'Room_ID': rooms, 'Name': [f'Room {i}' for i in range(1, len(rooms) + 1)],
+                  'Building': [room.split('N')[0] for room in rooms]}
+                 ).to_csv(os.path.join(output_dir, 'rooms.csv'), index=False)
+
+
+def write_dataset(output_dir, rooms=None, years=2, freq=FREQ, start=START, seed=0):
+    """Write room, outdoor and metadata files to `output_dir`."""
+    rooms = room_lst if rooms is None else rooms
+    os.makedirs(output_dir, exist_ok=True)
+    outdoor = generate_outdoor(start, years, freq, seed)
+    outdoor.to_csv(os.path.join(output_dir, 'outdoor_data.csv'))
+    write_rooms(output_dir, rooms)
+    for i, room in enumerate(rooms):
+        generate_room(room, outdoor, seed + i + 1).to_csv(os.path.join(output_dir, f'Data_{room}.csv'))
+    for filename in METADATA:
+        shutil.copy(os.path.join(DATA_DIR, filename), output_dir)
+    return len(outdoor)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write a synthetic data set.')
+    parser.add_argument('output_dir')
+    parser.add_argument('--rooms', nargs='*', default=room_lst, help='room IDs (default: all rooms)')
+    parser.add_argument('--n-rooms', type=int, default=None, help='number of synthetic rooms, instead of --rooms')
+    parser.add_argument('--years', type=int, default=2)
+    parser.add_argument('--freq', default=FREQ, help='sampling interval, e.g. 15min, 5min')
+    parser.add_argument('--start', default=START)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rooms = room_ids(args.n_rooms) if args.n_rooms else args.rooms
+    rows = write_dataset(args.output_dir, rooms, args.years, args.freq, args.start, args.seed)
+    print(f'{len(rooms)} rooms, {rows} rows per room written to {args.output_dir}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,326 @@
+"""Interactive Vega-Lite charts of the statplots views.
+
+Each chart function has the name and arguments of its statplots figure, but returns a Vega-Lite
+spec (a dict) with the pre-aggregated data inline: box-plot statistics, comfort category
+percentages, non-empty density cells, daily values and decimated series. The browser draws the
+chart, so zoom, pan and tooltips need no server work. Specs are a few kB to a few hundred kB and
+are cached per room and data with the rendered figures (`chart`).
+matplotlib is not imported, the specs can be built in any process.
+"""
+import json
+
+import numpy as np
+import pandas as pd
+from settings import *
+from comfort_stats import category_table, summary_table
+from correlation import corr_matrix
+from degreedays import HEATING_BASE, COOLING_BASE
+from density import EXTENT, BINS
+from figcache import figure_cache, figure_key
+from rollups import OUTDOOR
+
+SCHEMA = 'https://vega.github.io/schema/vega-lite/v4.json'
+PERIODS = ['BASELINE', 'MOBISTYLE']
+# Same colors as statplots
+PERIOD_COLORS = ['#1f77b4', '#ff7f0e']
+COLORS_T_RH = ['#0054d1', '#00b2d1', '#80f2bf', '#4cb266', '#99cc66', '#f26366', '#cc1240', '#d3d3d3']
+COLORS_CO2_VOC = ['#4cb266', '#99cc66', '#f26366', '#cc1240', '#d3d3d3']
+COMFORT_COLOR = '#4cb266'
+LIMIT_COLOR = '#cc1240'
+MONTHS = pd.date_range(start='2018-1-1', periods=12, freq='MS').strftime('%b').tolist()
+# Buckets of the decimated temperature series, the browser draws every point
+SERIES_BUCKETS = 600
+DECIMALS = 2
+
+
+def records(df):
+    """Rows of a DataFrame as JSON records, missing values as null and timestamps in epoch milliseconds."""
+    return json.loads(df.to_json(orient='records', date_format='epoch', double_precision=DECIMALS))
+
+
+def spec(title, layer_or_mark, data=None, **kwargs):
+    chart = {'$schema': SCHEMA, 'title': title, 'width': 'container'}
+    if data is not None:
+        chart['data'] = {'values': records(data)}
+    chart.update(layer_or_mark)
+    chart.update(kwargs)
+    return chart
+
+
+def period_color(**kwargs):
+    return {'field': 'Monitoring_Period', 'type': 'nominal', 'title': None,
+            'scale': {'domain': PERIODS, 'range': PERIOD_COLORS}, **kwargs}
+
+
+def month_x(field='x'):
+    """Quantitative x encoding of month positions 0-11 (plus offsets) labelled with month names."""
+    return {'field': field, 'type': 'quantitative', 'title': None, 'scale': {'domain': [-.5, 11.5], 'nice': False},
+            'axis': {'values': list(range(12)), 'labelExpr': f'{json.dumps(MONTHS)}[datum.value]', 'grid': True}}
+
+
+def period_offsets(df, width=.18):
+    """Positions x, x1, x2 of the BASELINE (left) and MOBISTYLE (right) bars of each month."""
+    df['x'] = df['Month'] - 1 + np.where(df['Monitoring_Period'] == 'BASELINE', -.2, .2)
+    df['x1'], df['x2'] = df['x'] - width, df['x'] + width
+    return df
+
+
+def chart(func, *args, version=''):
+    """Spec of a chart function, built only if it is not in the figure cache."""
+    key = figure_key(func, args, {}, version, 'vl.json')
+    data = figure_cache.get(key, 'vl.json')
+    if data is None:
+        data = json.dumps(func(*args)).encode()
+        figure_cache.put(key, data, 'vl.json')
+    return json.loads(data)
+
+
+# BOX PLOTS
+def boxplot_monthly(stats, room, parameter, title, unit, limits=(), limit_color=COMFORT_COLOR):
+    """Monthly box plots of BASELINE and MOBISTYLE from box-plot statistics.
+    `limits` are (value, first month, last month, label) lines, months counted from 0.
+    """
+    data = stats[(stats['Room'] == room) & (stats['Parameter'] == parameter)]
+    data = period_offsets(data.loc[:, ['Monitoring_Period', 'Month', 'count', 'whislo', 'q1', 'med', 'q3', 'whishi']])
+    x = month_x()
+    y = {'type': 'quantitative', 'title': unit, 'scale': {'zero': False}}
+    tooltip = [{'field': field, 'type': 'quantitative'} for field in ['whislo', 'q1', 'med', 'q3', 'whishi', 'count']]
+    layers = [
+        {'mark': {'type': 'rule', 'color': '#404040'},
+         'encoding': {'x': x, 'y': dict(y, field='whislo'), 'y2': {'field': 'whishi'}}},
+        {'mark': {'type': 'bar', 'stroke': '#404040'},
+         'encoding': {'x': dict(x, field='x1'), 'x2': {'field': 'x2'}, 'y': dict(y, field='q1'), 'y2': {'field': 'q3'},
+                      'color': period_color(), 'tooltip': [{'field': 'Monitoring_Period'},
+                                                           {'field': 'Month', 'type': 'ordinal'}] + tooltip}},
+        {'mark': {'type': 'rule', 'color': '#404040', 'strokeWidth': 2},
+         'encoding': {'x': dict(x, field='x1'), 'x2': {'field': 'x2'}, 'y': dict(y, field='med')}},
+    ]
+    if limits:
+        lines = pd.DataFrame(list(limits), columns=['value', 'x1', 'x2', 'label'])
+        layers.append({'data': {'values': records(lines)},
+                       'mark': {'type': 'rule', 'strokeDash': [4, 4], 'color': limit_color},
+                       'encoding': {'x': dict(x, field='x1'), 'x2': {'field': 'x2'}, 'y': dict(y, field='value'),
+                                    'tooltip': [{'field': 'label'}, {'field': 'value', 'type': 'quantitative'}]}})
+    return spec(title, {'layer': layers}, data, height=300)
+
+
+def plot_t_out(stats, parameter='Outdoor Temperature'):
+    unit = {'Outdoor Temperature': '[°C]', 'Outdoor RH': '[%]'}.get(parameter, '[W/m2]')
+    return boxplot_monthly(stats, OUTDOOR, parameter, f'Outdoor Air {parameter}. Slovenia, Ljubljana (Bežigrad)',
+                           unit)
+
+
+def plot_hdd(df, heating=HEATING_BASE, cooling=COOLING_BASE):
+    data = df.assign(Month=df.index.month, Monitoring_Period=np.where(df.index < pd.Timestamp(MS_start),
+                                                                      'BASELINE', 'MOBISTYLE'))
+    data = period_offsets(data[df.index < pd.Timestamp(MS_end)].reset_index())
+
+    def bars(field, title):
+        return {'mark': 'bar', 'height': 200, 'width': 'container', 'encoding': {
+            'x': month_x('x1'), 'x2': {'field': 'x2'},
+            'y': {'field': field, 'type': 'quantitative', 'title': title},
+            'color': period_color(),
+            'tooltip': [{'field': 'Monitoring_Period'}, {'field': 'Timestamp', 'type': 'temporal', 'format': '%b %Y'},
+                        {'field': field, 'type': 'quantitative', 'format': '.1f'}]}}
+    return spec(f'Heating (base {heating:g} °C) and cooling (base {cooling:g} °C) degree-days. Slovenia, Ljubljana',
+                {'vconcat': [bars('HDDs', 'HDD [K day]'), bars('CDDs', 'CDD [K day]')]}, data)
+
+
+def boxplot_monthly_temp(stats, room_name):
+    limits = [(25, -.5, 3.7, 'Comfort cat. II+'), (21, -.5, 3.7, 'Comfort cat. II-'),
+              (27, 3.7, 8.5, 'Comfort cat. II+'), (23, 3.7, 8.5, 'Comfort cat. II-'),
+              (25, 8.5, 11.5, 'Comfort cat. II+'), (21, 8.5, 11.5, 'Comfort cat. II-')]
+    return boxplot_monthly(stats, room_dct[room_name], 'Temperature',
+                           f'Indoor air temperature (Room Occupied). {room_name}', '[°C]', limits)
+
+
+def boxplot_monthly_rh(stats, room_name):
+    limits = [(60, -.5, 11.5, 'Comfort cat. II+'), (30, -.5, 11.5, 'Comfort cat. II-')]
+    return boxplot_monthly(stats, room_dct[room_name], 'RH',
+                           f'Indoor air Relative Humidity levels (Room Occupied). {room_name}', '[%]', limits)
+
+
+def boxplot_monthly_co2(stats, room_name):
+    return boxplot_monthly(stats, room_dct[room_name], 'CO2', f'Indoor air CO2 levels (Room Occupied). {room_name}',
+                           '[ppm]', [(1200, -.5, 11.5, 'Comfort cat. IV+')], LIMIT_COLOR)
+
+
+def boxplot_monthly_voc(stats, room_name):
+    return boxplot_monthly(stats, room_dct[room_name], 'VOC', f'Indoor air VOC levels (Room Occupied). {room_name}',
+                           '[ppb]', [(100, -.5, 11.5, 'Comfort cat. IV+')], LIMIT_COLOR)
+
+
+# INDOOR CLIMATE
+def plot_temp(df, room_name=None):
+    """Office and outdoor temperature decimated to SERIES_BUCKETS buckets, zoom and pan with the mouse."""
+    df = df.loc[:, ['Temperature', 'Outdoor Temperature']]
+    # Short field names, the series has a few thousand rows
+    df = df.set_axis(['Office', 'Outdoor'], axis=1).rename_axis('Timestamp').reset_index()
+    title = f'Office and outdoor temperature. {room_name}' if room_name else 'Office and outdoor temperature'
+    return spec(title, {
+        'transform': [{'fold': ['Office', 'Outdoor'], 'as': ['Series', 'Value']}],
+        'mark': {'type': 'line', 'strokeWidth': 1},
+        'selection': {'zoom': {'type': 'interval', 'bind': 'scales', 'encodings': ['x']}},
+        'encoding': {
+            'x': {'field': 'Timestamp', 'type': 'temporal', 'title': None},
+            'y': {'field': 'Value', 'type': 'quantitative', 'title': '(°C)', 'scale': {'domain': [-15, 40]}},
+            'color': {'field': 'Series', 'type': 'nominal', 'title': None,
+                      'scale': {'range': ['darkblue', 'grey']}},
+            'tooltip': [{'field': 'Timestamp', 'type': 'temporal', 'format': '%Y-%m-%d %H:%M'},
+                        {'field': 'Series'}, {'field': 'Value', 'type': 'quantitative'}]},
+    }, df, height=300)
+
+
+def plot_density_temp(grids, room_name, seasonal=False):
+    """Office vs Outdoor temperature density, cells with samples only."""
+    seasons = sorted({season for _, season in grids if season != 'All'}) if seasonal else ['All']
+    dx, dy = (EXTENT[1] - EXTENT[0]) / BINS[0], (EXTENT[3] - EXTENT[2]) / BINS[1]
+    tables = []
+    for period in PERIODS:
+        for season in seasons:
+            counts = grids[(period, season)]
+            ix, iy = np.nonzero(counts)
+            tables.append(pd.DataFrame({'Monitoring_Period': period, 'Season': season,
+                                        'x1': EXTENT[0] + ix * dx, 'x2': EXTENT[0] + (ix + 1) * dx,
+                                        'y1': EXTENT[2] + iy * dy, 'y2': EXTENT[2] + (iy + 1) * dy,
+                                        'Samples': counts[ix, iy]}))
+    data = pd.concat(tables, ignore_index=True)
+    facet = {'column': {'field': 'Monitoring_Period', 'title': None}}
+    if seasonal:
+        facet['row'] = {'field': 'Season', 'title': None}
+    return {'$schema': SCHEMA, 'title': f'Office and Outdoor temperature. {room_name}',
+            'data': {'values': records(data)}, 'facet': facet,
+            'spec': {'width': 250, 'height': 250, 'mark': 'rect', 'encoding': {
+                'x': {'field': 'x1', 'type': 'quantitative', 'title': 'Office Temperature (°C)',
+                      'scale': {'domain': list(EXTENT[:2]), 'nice': False}},
+                'x2': {'field': 'x2'},
+                'y': {'field': 'y1', 'type': 'quantitative', 'title': 'Outdoor Temperature (°C)',
+                      'scale': {'domain': list(EXTENT[2:]), 'nice': False}},
+                'y2': {'field': 'y2'},
+                'color': {'field': 'Samples', 'type': 'quantitative', 'scale': {'scheme': 'blues'}},
+                'tooltip': [{'field': 'x1', 'title': 'Office from'}, {'field': 'y1', 'title': 'Outdoor from'},
+                            {'field': 'Samples', 'type': 'quantitative'}]}}}
+
+
+# THERMAL COMFORT
+def category_bars(table, title, labels, colors):
+    """Stacked horizontal bars of the time (%) in comfort categories, one panel per monitoring period."""
+    return {'$schema': SCHEMA, 'title': title, 'data': {'values': records(table)},
+            'facet': {'column': {'field': 'Monitoring_Period', 'title': None, 'sort': PERIODS}},
+            'spec': {'width': 300, 'mark': 'bar', 'encoding': {
+                'y': {'field': 'Row', 'type': 'nominal', 'title': None, 'sort': None},
+                'x': {'field': 'Value', 'type': 'quantitative', 'stack': 'zero', 'title': 'Time (%)',
+                      'scale': {'domain': [0, 100]}},
+                'color': {'field': 'Category', 'type': 'nominal', 'title': None,
+                          'scale': {'domain': labels, 'range': colors}, 'legend': {'orient': 'bottom'}},
+                'order': {'field': 'Order', 'type': 'quantitative'},
+                'tooltip': [{'field': 'Row', 'title': ''}, {'field': 'Category'},
+                            {'field': 'Value', 'type': 'quantitative', 'format': '.1f'}]}}}
+
+
+def long_table(tables, labels):
+    """(Monitoring_Period -> table of category columns) as rows of Monitoring_Period, Row, Category, Value."""
+    rows = []
+    for period, table in tables.items():
+        table = table.reindex(columns=labels).fillna(0).round(1)
+        long = table.rename_axis(index='Row', columns='Category').stack().rename('Value').reset_index()
+        long.insert(0, 'Monitoring_Period', period)
+        long['Order'] = long['Category'].map({label: i for i, label in enumerate(labels)})
+        long['Row'] = long['Row'].astype(str)
+        rows.append(long)
+    return pd.concat(rows, ignore_index=True)
+
+
+def plot_comfort_cat(stats, room_name, parameter, labels, colors):
+    labels = labels + ['Missing data']
+    tables = {period: category_table(stats, room_dct[room_name], parameter, period) for period in PERIODS}
+    return category_bars(long_table(tables, labels),
+                         f'Time Distribution (%) in Comfort Categories. {parameter} for {room_name}', labels, colors)
+
+
+def plot_comfort_cat_temp_rh(stats, room_name, parameter):
+    return plot_comfort_cat(stats, room_name, parameter, labels_T_RH, COLORS_T_RH)
+
+
+def plot_comfort_cat_co2_voc(stats, room_name, parameter):
+    return plot_comfort_cat(stats, room_name, parameter, labels_CO2_VOC, COLORS_CO2_VOC)
+
+
+def plot_comfort_cat_summary_temp(stats, rooms=None):
+    rooms = room_lst if rooms is None else rooms
+    labels = labels_T_RH + ['Missing data']
+    names = dict(zip(room_lst, room_names))
+    tables = {period: summary_table(stats, 'Temperature', period, rooms).rename(index=names)
+              for period in PERIODS}
+    return category_bars(long_table(tables, labels),
+                         'Time Distribution (%) in Comfort Categories. Temperature (Room Occupied)',
+                         labels, COLORS_T_RH)
+
+
+# WINDOW OPENINGS
+def plot_monthly_window(window, room_name):
+    data = pd.DataFrame({'Month': window.index.month, 'Openings': window['Openings'],
+                         'Time open (%)': window['Open'] / window['Samples'].where(window['Samples'] > 0) * 100,
+                         'Monitoring_Period': np.where(window.index < pd.Timestamp(MS_start), 'BASELINE', 'MOBISTYLE')})
+    data = period_offsets(data.groupby(['Monitoring_Period', 'Month']).mean().reset_index())
+
+    def bars(field, title):
+        return {'mark': 'bar', 'height': 200, 'width': 'container', 'encoding': {
+            'x': month_x('x1'), 'x2': {'field': 'x2'},
+            'y': {'field': field, 'type': 'quantitative', 'title': title},
+            'color': period_color(),
+            'tooltip': [{'field': 'Monitoring_Period'}, {'field': 'Month', 'type': 'ordinal'},
+                        {'field': field, 'type': 'quantitative', 'format': '.1f'}]}}
+    return spec(f'Window opening data. {room_name}',
+                {'vconcat': [bars('Openings', 'Opening (count)'), bars('Time open (%)', 'Time open (pct)')]}, data)
+
+
+def plot_window_temp_out(df, room_name):
+    data = df.loc[df['Room Status'] > 0, ['Monitoring_Period', 'Temperature', 'Outdoor Temperature', 'Window State']]
+    data = data.assign(**{'Window open (%)': data.pop('Window State') * 100}).rename_axis('Day').reset_index()
+    return {'$schema': SCHEMA, 'title': f'Window open state, Indoor and Outdoor Temperature. {room_name}',
+            'data': {'values': records(data)},
+            'facet': {'column': {'field': 'Monitoring_Period', 'title': None, 'sort': PERIODS}},
+            'spec': {'width': 300, 'height': 250, 'mark': {'type': 'point', 'filled': True},
+                     'selection': {'zoom': {'type': 'interval', 'bind': 'scales'}}, 'encoding': {
+                'x': {'field': 'Temperature', 'type': 'quantitative', 'title': 'Office Temperature (°C)',
+                      'scale': {'zero': False}},
+                'y': {'field': 'Outdoor Temperature', 'type': 'quantitative', 'title': 'Outdoor Temperature (°C)'},
+                'color': {'field': 'Window open (%)', 'type': 'quantitative', 'scale': {'scheme': 'greenblue'}},
+                'tooltip': [{'field': 'Day', 'type': 'temporal'}, {'field': 'Temperature', 'type': 'quantitative'},
+                            {'field': 'Outdoor Temperature', 'type': 'quantitative'},
+                            {'field': 'Window open (%)', 'type': 'quantitative', 'format': '.0f'}]}}}
+
+
+# CORRELATION MATRIX
+def plot_corr_matrix(corrs, room_name, period):
+    corr = corr_matrix(corrs, period)
+    labels = [column.replace('_', ' ') for column in corr.columns]
+    corr = pd.DataFrame(corr.to_numpy(), index=labels, columns=labels)
+    # Lower triangle, as in the figure
+    mask = np.tril(np.ones(corr.shape, dtype=bool), -1)
+    data = corr.where(mask).rename_axis(index='y', columns='x').stack().rename('r').reset_index()
+    encoding = {'x': {'field': 'x', 'type': 'nominal', 'sort': labels, 'title': None},
+                'y': {'field': 'y', 'type': 'nominal', 'sort': labels, 'title': None}}
+    return spec(f'Correlation matrix for {room_name}. {period}', {'layer': [
+        {'mark': 'rect', 'encoding': dict(encoding, color={
+            'field': 'r', 'type': 'quantitative', 'title': 'Correlation coefficient',
+            'scale': {'scheme': 'redblue', 'reverse': True, 'domain': [-1, 1]}},
+            tooltip=[{'field': 'x'}, {'field': 'y'}, {'field': 'r', 'type': 'quantitative', 'format': '.2f'}])},
+        {'mark': {'type': 'text', 'fontSize': 9}, 'encoding': dict(encoding, text={
+            'field': 'r', 'type': 'quantitative', 'format': '.2f'})},
+    ]}, data, height=450)
+
+
+def plot_corr_rooms(table, x, y):
+    data = table.rename_axis(index='Room', columns='Monitoring_Period').stack().rename('r').reset_index()
+    return spec(f'Correlation of {x} and {y} (daily data, room occupied)', {
+        'mark': 'bar', 'encoding': {
+            'row': {'field': 'Room', 'type': 'nominal', 'sort': list(table.index), 'title': None,
+                    'header': {'labelAngle': 0, 'labelAlign': 'left'}},
+            'y': {'field': 'Monitoring_Period', 'type': 'nominal', 'title': None, 'axis': None},
+            'x': {'field': 'r', 'type': 'quantitative', 'title': 'Spearman correlation coefficient',
+                  'scale': {'domain': [-1, 1]}},
+            'color': period_color(),
+            'tooltip': [{'field': 'Room'}, {'field': 'Monitoring_Period'},
+                        {'field': 'r', 'type': 'quantitative', 'format': '.2f'}]}}, data)
@@ -0,0 +1,50 @@
+"""Background warm-up of the app caches.
+
+Enabled with MOBISTYLE_WARMUP=1. The first run of the app starts one daemon thread per server
+process, which imports the room page with its plotting modules and loads the datasets and
+aggregates the room page shows by default, while the first user is still on the Home page.
+A dataset is loaded under its own registry lock, so a page asking for a dataset that is being
+warmed up waits on that lock while the dataset is loaded once.
+"""
+import os
+import threading
+import time
+
+from settings import *
+
+ENABLED = os.environ.get('MOBISTYLE_WARMUP', '') not in ('', '0')
+# Registry datasets of the default room page, {room} is the first room
+DATASETS = ['comfort_stats', 'portfolio', 'box_stats', 'density_{room}']
+
+_thread = None
+_lock = threading.Lock()
+_seconds = None
+
+
+def warm_up(datasets=DATASETS):
+    global _seconds
+    start = time.perf_counter()
+    import room  # noqa: F401, page module and plotting dependencies
+    from registry import registry
+    registry.sync()
+    for name in datasets:
+        registry.get(name.format(room=room_lst[0]))
+    _seconds = time.perf_counter() - start
+
+
+def start():
+    """Start the warm-up thread once per process if enabled."""
+    global _thread
+    with _lock:
+        if ENABLED and _thread is None:
+            _thread = threading.Thread(target=warm_up, name='warm-up', daemon=True)
+            _thread.start()
+    return _thread
+
+
+def status():
+    if _thread is None:
+        return 'not started'
+    if _thread.is_alive():
+        return 'running'
+    return f'done in {_seconds:.1f} s' if _seconds is not None else 'failed'